@@ -0,0 +1,125 @@
+import struct
+import threading
+import numpy as np
+
+
+def wav_header(rate, channels, sample_width):
+    """WAV header for a stream of unknown length"""
+    byte_rate = rate * channels * sample_width
+    return (b'RIFF' + struct.pack('<I', 0xFFFFFFFF) + b'WAVE' +
+            b'fmt ' + struct.pack('<IHHIIHH', 16, 1, channels, rate, byte_rate,
+                                  channels * sample_width, 8 * sample_width) +
+            b'data' + struct.pack('<I', 0xFFFFFFFF))
+
+
+class AudioListener:
+    """Read cursor into an AudioHub's ring buffer"""
+
+    def __init__(self, hub):
+        self.hub = hub
+        self.cursor = hub.position
+        self.overruns = 0
+
+    def read(self, timeout=1.0):
+        """Return the samples captured since the last read as bytes, or None on timeout
+
+        A listener that fell more than the ring's length behind skips ahead
+        to the oldest samples still available and counts an overrun.
+        """
+        hub = self.hub
+        with hub.condition:
+            if not hub.condition.wait_for(lambda: hub.position > self.cursor, timeout):
+                return None
+            end = hub.position
+            if end - self.cursor > hub.capacity:
+                self.cursor = end - hub.capacity
+                self.overruns += 1
+                hub.overruns += 1
+            start = self.cursor % hub.capacity
+            count = end - self.cursor
+            if start + count <= hub.capacity:
+                data = hub.ring[start:start + count].tobytes()
+            else:
+                data = (hub.ring[start:].tobytes() +
+                        hub.ring[:count - (hub.capacity - start)].tobytes())
+            self.cursor = end
+        return data
+
+    def close(self):
+        self.hub.remove_listener(self)
+
+
+class AudioHub:
+    """Single microphone capture shared by any number of listeners
+
+    Captured samples are written into a preallocated ring buffer; each
+    listener keeps its own read cursor, so a slow listener never stalls
+    capture.
+    """
+
+    def __init__(self, open_audio, chunk, rate, channels=1, seconds=4):
+        self.open_audio = open_audio
+        self.chunk = chunk
+        self.rate = rate
+        self.channels = channels
+        self.capacity = rate * channels * seconds
+        self.ring = np.zeros(self.capacity, dtype=np.int16)
+        # Total samples written since start
+        self.position = 0
+        self.condition = threading.Condition()
+        self.listeners = set()
+        self.overruns = 0
+        self.audio = None
+        self.stream = None
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        self.audio, self.stream = self.open_audio()
+        if not self.audio or not self.stream:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._capture_loop)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread:
+            self.thread.join()
+
+    def listen(self):
+        listener = AudioListener(self)
+        with self.condition:
+            self.listeners.add(listener)
+        return listener
+
+    def remove_listener(self, listener):
+        with self.condition:
+            self.listeners.discard(listener)
+
+    def stats(self):
+        with self.condition:
+            return {'listeners': len(self.listeners), 'overruns': self.overruns}
+
+    def _write(self, samples):
+        count = len(samples)
+        start = self.position % self.capacity
+        first = min(count, self.capacity - start)
+        self.ring[start:start + first] = samples[:first]
+        self.ring[:count - first] = samples[first:]
+        with self.condition:
+            self.position += count
+            self.condition.notify_all()
+
+    def _capture_loop(self):
+        try:
+            while self.running:
+                data = self.stream.read(self.chunk, exception_on_overflow=False)
+                self._write(np.frombuffer(data, dtype=np.int16))
+        except Exception as e:
+            print(f"Audio streaming error: {e}")
+        finally:
+            self.stream.stop_stream()
+            self.stream.close()
+            self.audio.terminate()
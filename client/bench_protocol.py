@@ -0,0 +1,79 @@
+# bench_protocol.py - Compare the framed binary protocol with the old pickle path
+import pickle
+import timeit
+import numpy as np
+import protocol
+
+FRAME_WIDTH = 320
+FRAME_HEIGHT = 240
+AUDIO_RATE = 44100
+AUDIO_SECONDS = 1
+REPEAT = 200
+
+
+def make_frame():
+    """Synthetic BGR frame: smooth gradients with sensor-like noise"""
+    y, x = np.mgrid[0:FRAME_HEIGHT, 0:FRAME_WIDTH]
+    frame = np.stack([x * 255 // FRAME_WIDTH,
+                      y * 255 // FRAME_HEIGHT,
+                      (x + y) * 255 // (FRAME_WIDTH + FRAME_HEIGHT)], axis=-1)
+    noise = np.random.default_rng(0).integers(-8, 8, frame.shape)
+    return np.clip(frame + noise, 0, 255).astype(np.uint8)
+
+
+def make_audio():
+    t = np.arange(AUDIO_RATE * AUDIO_SECONDS) / AUDIO_RATE
+    return (np.sin(2 * np.pi * 220 * t) * 8000).astype(np.int16).tobytes()
+
+
+# Pickle path as previously used by AttendanceClient
+def pickle_encode_frame(frame):
+    message_bytes = pickle.dumps({'type': 'frame', 'data': pickle.dumps(frame)})
+    return len(message_bytes).to_bytes(4, byteorder='big') + message_bytes
+
+
+def pickle_decode_frame(data):
+    message = pickle.loads(data[4:])
+    return pickle.loads(message['data'])
+
+
+def pickle_encode_audio(pcm):
+    message_bytes = pickle.dumps({'type': 'audio', 'data': pcm, 'user_id': None})
+    return len(message_bytes).to_bytes(4, byteorder='big') + message_bytes
+
+
+def pickle_decode_audio(data):
+    return pickle.loads(data[4:])['data']
+
+
+def binary_decode_frame(data):
+    _, payload = protocol.split_message(data)
+    return protocol.decode_frame(payload)
+
+
+def binary_decode_audio(data):
+    _, payload = protocol.split_message(data)
+    return protocol.decode_audio(payload)['data']
+
+
+def measure(name, encode, decode, value):
+    message = encode(value)
+    encode_time = timeit.timeit(lambda: encode(value), number=REPEAT) / REPEAT
+    decode_time = timeit.timeit(lambda: decode(message), number=REPEAT) / REPEAT
+    print(f"{name:<16} {len(message):>10} {encode_time * 1e6:>12.1f} {decode_time * 1e6:>12.1f}")
+
+
+def main():
+    frame = make_frame()
+    pcm = make_audio()
+
+    print(f"{'message':<16} {'bytes':>10} {'encode (us)':>12} {'decode (us)':>12}")
+    measure("frame/pickle", pickle_encode_frame, pickle_decode_frame, frame)
+    measure("frame/binary", lambda f: protocol.encode_frame(f, 80), binary_decode_frame, frame)
+    measure("audio/pickle", pickle_encode_audio, pickle_decode_audio, pcm)
+    measure("audio/binary", lambda p: protocol.encode_audio(p, AUDIO_RATE, 1, 2),
+            binary_decode_audio, pcm)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+# bench_stream.py - Client send paths against loopback receivers, no camera or microphone needed
+import email.parser
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import protocol
+from capture_hub import CaptureHub
+from change_gate import ChangeGate
+from congestion import AdaptiveController
+from fake_devices import SyntheticCapture, SyntheticMicrophone
+from frame_broker import FrameBroker
+from latency import Histogram
+from receiver import ResponseReceiver
+from uploader import FrameUploader
+from uplink import FrameSender, VoiceRecorder
+from bench_harness import WARMUP, result, main
+
+# AttendanceClient's microphone rate (client.py RATE)
+RATE = 44100
+UTTERANCE_SECONDS = 3.0
+
+
+class Receiver:
+    """Counters shared by the loopback receivers; cpu is receiver thread time"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.messages = 0
+        self.bytes = 0
+        self.cpu = 0.0
+        self.latency = Histogram()
+
+    def record(self, size, timestamp, cpu=0.0):
+        with self.lock:
+            self.messages += 1
+            self.bytes += size
+            self.cpu += cpu
+            if timestamp is not None:
+                self.latency.record((time.monotonic() - timestamp) * 1e6)
+
+    def snapshot(self):
+        with self.lock:
+            snapshot = (self.messages, self.bytes, self.cpu)
+            self.latency = Histogram()
+        return snapshot
+
+
+class FramedReceiver(Receiver):
+    """Stands in for the attendance server: framed protocol messages over TCP
+
+    Every frame or audio chunk is answered with a JSON ack echoing its
+    seq and timestamp, as the server does.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.server = socket.create_server(('127.0.0.1', 0))
+        self.port = self.server.getsockname()[1]
+        self.conn = None
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._receive_loop)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.server.close()
+        if self.conn:
+            try:
+                self.conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                # Already reset by the client closing with acks unread
+                pass
+        self.thread.join()
+
+    def _handle(self, msg_type, payload):
+        if msg_type == protocol.MSG_FRAME:
+            seq, timestamp = protocol.frame_stamp(payload)
+        elif msg_type == protocol.MSG_AUDIO_CHUNK:
+            chunk = protocol.decode_audio_chunk(payload)
+            seq, timestamp = chunk['seq'], chunk['timestamp']
+        else:
+            return
+        self.conn.sendall(protocol.encode_json({
+            'type': 'ack',
+            'echo': {'stream': msg_type, 'seq': seq, 'timestamp': timestamp},
+        }))
+        # CPU is accounted for around pump()
+        self.record(protocol.HEADER.size + len(payload), timestamp)
+
+    def _receive_loop(self):
+        try:
+            self.conn, _ = self.server.accept()
+            reader = protocol.MessageReader(self.conn)
+            while True:
+                start = time.thread_time()
+                reader.pump(self._handle)
+                with self.lock:
+                    self.cpu += time.thread_time() - start
+        except (OSError, ConnectionError):
+            pass
+
+
+class UploadReceiver(Receiver):
+    """Stands in for the /process_frame endpoint: multipart/form-data POSTs
+
+    Frames carry no timestamp on this path, so latency is looked up from
+    the capture time recorded for each frame's bytes in sent.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.sent = {}
+        receiver = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                start = time.thread_time()
+                body = self.rfile.read(int(self.headers['Content-Length']))
+                message = email.parser.BytesParser().parsebytes(
+                    b'Content-Type: ' + self.headers['Content-Type'].encode() + b'\r\n\r\n' + body)
+                frame = None
+                for part in message.get_payload():
+                    if part.get_param('name', header='content-disposition') == 'frame':
+                        frame = part.get_payload(decode=True)
+                self.send_response(200)
+                self.send_header('Content-Length', '2')
+                self.end_headers()
+                self.wfile.write(b'ok')
+                timestamp = receiver.sent.pop(frame, None) if frame else None
+                receiver.record(len(body), timestamp, time.thread_time() - start)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def measure(name, receiver, seconds):
+    """Let the client run; CPU is the process total minus the receiver's"""
+    time.sleep(WARMUP)
+    messages, size, receiver_cpu = receiver.snapshot()
+    start, start_cpu = time.monotonic(), time.process_time()
+    time.sleep(seconds)
+    elapsed = time.monotonic() - start
+    with receiver.lock:
+        cpu = time.process_time() - start_cpu - (receiver.cpu - receiver_cpu)
+        messages = receiver.messages - messages
+        size = receiver.bytes - size
+        latency = receiver.latency
+    return result(name, messages, size, cpu, elapsed, latency)
+
+
+def connect_framed(receiver):
+    sock = socket.create_connection(('127.0.0.1', receiver.port))
+    # Acks are read and dropped, as AttendanceClient queues them for the UI
+    responses = ResponseReceiver(sock, lambda response: None)
+    responses.start()
+    return sock, responses
+
+
+def bench_framed_video(seconds, gated=True):
+    """AttendanceClient's FrameSender: change-gated JPEG frames over the framed protocol"""
+    receiver = FramedReceiver()
+    receiver.start()
+    sock, responses = connect_framed(receiver)
+    frames = FrameBroker(SyntheticCapture())
+    # threshold=0 lets every checked frame through the gate's change test
+    gate = ChangeGate() if gated else ChangeGate(threshold=0, cooldown=0)
+    sender = FrameSender(frames.subscribe('sender'), sock.sendall, gate)
+    frames.start()
+    sender.start()
+    result = measure('framed-video' if gated else 'framed-video-ungated', receiver, seconds)
+    sender.stop()
+    frames.stop()
+    responses.stop()
+    sock.close()
+    receiver.stop()
+    return result
+
+
+def bench_framed_voice(seconds):
+    """AttendanceClient's VoiceRecorder: trimmed PCM chunks over the framed protocol"""
+    receiver = FramedReceiver()
+    receiver.start()
+    sock, responses = connect_framed(receiver)
+    recorder = VoiceRecorder(sock.sendall, RATE)
+    microphone = SyntheticMicrophone(RATE)
+    running = True
+
+    def record_audio():
+        utterance_id = 0
+        while running:
+            # Utterances of UTTERANCE_SECONDS, as if the button were held
+            utterance_id += 1
+            end = time.monotonic() + UTTERANCE_SECONDS
+            recorder.record(microphone, utterance_id,
+                            lambda: running and time.monotonic() < end)
+
+    thread = threading.Thread(target=record_audio)
+    thread.start()
+    result = measure('framed-voice', receiver, seconds)
+    running = False
+    thread.join()
+    responses.stop()
+    sock.close()
+    receiver.stop()
+    return result
+
+
+def bench_multipart_upload(seconds):
+    """client1: shared capture hub posting frames as multipart/form-data"""
+    receiver = UploadReceiver()
+    receiver.start()
+    camera = SyntheticCapture()
+    controller = AdaptiveController(0.3, min_quality=15, max_quality=50, min_fps=2, max_fps=10)
+    uploader = FrameUploader(f"http://127.0.0.1:{receiver.port}/process_frame", 'bench', controller)
+
+    def on_frame(frame_bytes):
+        receiver.sent[frame_bytes] = camera.timestamp
+        uploader.submit(frame_bytes)
+
+    hub = CaptureHub(lambda: camera, controller, on_frame=on_frame)
+    uploader.start()
+    hub.start()
+    result = measure('multipart-upload', receiver, seconds)
+    hub.stop()
+    uploader.stop()
+    receiver.stop()
+    return result
+
+
+VARIANTS = {
+    'framed-video': bench_framed_video,
+    'framed-video-ungated': lambda seconds: bench_framed_video(seconds, gated=False),
+    'framed-voice': bench_framed_voice,
+    'multipart-upload': bench_multipart_upload,
+}
+
+
+if __name__ == "__main__":
+    main("Benchmark the client send paths against loopback receivers", VARIANTS)
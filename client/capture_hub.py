@@ -0,0 +1,91 @@
+import itertools
+import threading
+import time
+import cv2
+from frame_broker import FrameBroker, CAPTURE_TIME
+from metrics import REGISTRY
+
+ENCODE_TIME = REGISTRY.timer('camera_encode_seconds', 'Time to resize and JPEG-encode one frame')
+
+
+class CaptureHub:
+    """One capture-and-encode thread broadcasting JPEG frames to any number of viewers
+
+    Every viewer subscribes to its own latest-frame slot, so a slow viewer
+    only misses frames instead of holding up the others. Each encoded frame
+    is also passed to on_frame (e.g. an uploader).
+    """
+
+    def __init__(self, open_camera, controller, on_frame=None):
+        self.open_camera = open_camera
+        self.controller = controller
+        self.on_frame = on_frame
+        self.camera = None
+        self.frames = FrameBroker()
+        self.viewer_ids = itertools.count(1)
+        self.running = False
+        self.thread = None
+        self.read_failures = 0
+
+    def start(self):
+        self.camera = self.open_camera()
+        if self.camera is None or not self.camera.isOpened():
+            print("Camera not available")
+            self.camera = None
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._capture_loop)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.frames.stop()
+        if self.thread:
+            self.thread.join()
+        if self.camera:
+            self.camera.release()
+
+    def subscribe(self):
+        return self.frames.subscribe(f"viewer-{next(self.viewer_ids)}")
+
+    def unsubscribe(self, viewer):
+        self.frames.unsubscribe(viewer)
+
+    def stats(self):
+        return {
+            'captured': self.frames.seq,
+            'read_failures': self.read_failures,
+            'viewers': len(self.frames.consumers),
+        }
+
+    def _capture_loop(self):
+        while self.running:
+            try:
+                frame_start = time.monotonic()
+                success, frame = self.camera.read()
+                encode_start = time.monotonic()
+                CAPTURE_TIME.observe(encode_start - frame_start)
+                if not success:
+                    self.read_failures += 1
+                    print("Failed to get frame")
+                    time.sleep(0.1)
+                    continue
+
+                # Encode frame to JPEG once for every consumer
+                frame = self.controller.resize(frame)
+                ret, buffer = cv2.imencode('.jpg', frame,
+                                           [cv2.IMWRITE_JPEG_QUALITY, self.controller.quality])
+                frame_bytes = buffer.tobytes()
+                ENCODE_TIME.observe(time.monotonic() - encode_start)
+                self.frames.publish(frame_bytes)
+                if self.on_frame:
+                    self.on_frame(frame_bytes)
+
+                # Frame rate follows the adaptive controller
+                delay = self.controller.frame_interval - (time.monotonic() - frame_start)
+                if delay > 0:
+                    time.sleep(delay)
+            except Exception as e:
+                print(f"Frame capture error: {e}")
+                time.sleep(0.5)
@@ -0,0 +1,67 @@
+import time
+import cv2
+import numpy as np
+
+
+class ChangeGate:
+    """Decide whether a frame differs enough from the last one sent to upload it
+
+    Frames are compared on a small grayscale copy. A frame is sent when the
+    fraction of changed pixels reaches `threshold` and at least `cooldown`
+    seconds have passed since the last upload, or unconditionally once
+    `keepalive` seconds have passed without one. should_send() only
+    decides; the caller reports each frame it actually uploads with
+    commit(), so frames let through but not sent leave the gate unchanged.
+    """
+
+    def __init__(self, threshold=0.02, cooldown=1.0, keepalive=30.0,
+                 pixel_delta=25, size=(80, 60)):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.keepalive = keepalive
+        self.pixel_delta = pixel_delta
+        self.size = size
+        self.reference = None
+        self.last_sent_time = 0.0
+        self.sent = 0
+        self.suppressed = 0
+        # Scratch buffers reused for every frame
+        self.small = np.empty((size[1], size[0]), dtype=np.uint8)
+        self.diff = np.empty_like(self.small)
+
+    def _downsample(self, frame):
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+        return cv2.resize(gray, self.size, dst=self.small, interpolation=cv2.INTER_AREA)
+
+    def change(self, small):
+        """Fraction of pixels that differ from the reference frame"""
+        cv2.absdiff(small, self.reference, dst=self.diff)
+        return np.count_nonzero(self.diff > self.pixel_delta) / self.diff.size
+
+    def should_send(self, frame, now=None):
+        if now is None:
+            now = time.monotonic()
+        elapsed = now - self.last_sent_time
+
+        if self.reference is None or elapsed >= self.keepalive:
+            send = True
+        elif elapsed < self.cooldown:
+            send = False
+        else:
+            send = self.change(self._downsample(frame)) >= self.threshold
+
+        if not send:
+            self.suppressed += 1
+        return send
+
+    def commit(self, frame, now=None):
+        """Record that frame was uploaded"""
+        if now is None:
+            now = time.monotonic()
+        # Compare future frames with the last frame the server saw
+        self.reference = self._downsample(frame).copy()
+        self.last_sent_time = now
+        self.sent += 1
+
+    def stats(self):
+        return {'sent': self.sent, 'suppressed': self.suppressed}
@@ -1,7 +1,6 @@
 # client.py
 import cv2
 import socket
-import pickle
 import threading
 import pyaudio
 import wave
@@ -10,10 +9,22 @@ import io
 import pygame
 import os
 import queue
+import signal
+import numpy as np
 import tkinter as tk
 from tkinter import ttk
 import ttkbootstrap as ttk
 from PIL import Image, ImageTk
+from frame_broker import FrameBroker
+import protocol
+from receiver import ResponseReceiver
+from change_gate import ChangeGate
+from face_detector import FaceDetector
+from face_tracker import FaceTracker
+from uplink import FrameSender, VoiceRecorder
+from tts_cache import SpeechCache
+from latency import StreamMonitor, dump_all
+import metrics
 import warnings
 warnings.filterwarnings("ignore")
 
@@ -27,20 +38,83 @@ SERVER_IP = '192.168.83.133'  # Replace with your server's IP
 SERVER_PORT = 9999
 CAMERA_WIDTH = 320  # Reduced for Raspberry Pi
 CAMERA_HEIGHT = 240  # Reduced for Raspberry Pi
+# Preview redraw rate, independent of the camera's capture rate
+PREVIEW_FPS = 15
+JPEG_QUALITY = 80
+# Frame upload gating: frames are checked every FRAME_CHECK_INTERVAL seconds
+# and only uploaded when the scene changed, at most once per CHANGE_COOLDOWN
+# and at least once per KEEPALIVE_INTERVAL
+FRAME_CHECK_INTERVAL = 0.2
+CHANGE_THRESHOLD = 0.02  # Fraction of changed pixels
+CHANGE_COOLDOWN = 1.0
+KEEPALIVE_INTERVAL = 30.0
+# Edge detection: find faces here and upload only their crops, at the
+# camera's resolution, instead of the whole downscaled frame. Frames
+# without a face are not uploaded. The camera captures at the larger
+# EDGE_CAMERA size so the crops have enough pixels for recognition.
+EDGE_DETECTION = False
+EDGE_CAMERA_WIDTH = 640
+EDGE_CAMERA_HEIGHT = 480
+FACE_JPEG_QUALITY = 90
+# Faces are tracked across frames; once the server recognized a track it is
+# not uploaded again for RESOLVED_TTL seconds or until the face is lost.
+# A new track is uploaded at once; one the server has not recognized yet is
+# retried after TRACK_RETRY seconds, doubling up to TRACK_MAX_RETRY
+TRACK_IOU_THRESHOLD = 0.3
+TRACK_MAX_AGE = 2.0
+RESOLVED_TTL = 300.0
+TRACK_RETRY = 1.0
+TRACK_MAX_RETRY = 30.0
 AUDIO_FORMAT = pyaudio.paInt16
 CHANNELS = 1
 RATE = 44100
 CHUNK = 1024
 RECORD_SECONDS = 5
+# Voice commands: stream chunks while recording instead of sending on release
+STREAM_VOICE = True
+VAD_ENABLED = True
+VAD_THRESHOLD = 500  # RMS level of a voiced int16 chunk
+# Text-to-speech
+TTS_VOICE = 'en'
+TTS_SPEED = 175
+TTS_CACHE_SIZE = 32
+TTS_PREWARM_PHRASES = [
+    "Sorry, I didn't understand that.",
+    "Please look at the camera.",
+]
+# Prometheus metrics on http://<client>:METRICS_PORT/metrics, None to disable
+# (not 9100, which node_exporter usually holds)
+METRICS_PORT = 8005
+
+SEND_TIME = metrics.REGISTRY.timer('send_seconds', 'Time blocked sending one message')
+BYTES_SENT = metrics.REGISTRY.counter('sent_bytes', 'Message bytes sent to the server')
+SPEECH_TIME = metrics.REGISTRY.timer('speech_start_seconds',
+                                     'Time from a speech response to its playback starting')
+RENDER_TIME = metrics.REGISTRY.timer('preview_render_seconds',
+                                     'Time to scale and draw one preview frame')
+DISPATCH_TIME = metrics.REGISTRY.timer('response_dispatch_seconds',
+                                       'Time from a response being queued to its redraw')
+# Posted by pygame when the speech channel finishes playing
+SPEECH_DONE = pygame.USEREVENT + 1
 
 # Global variables
 running = True
 audio_queue = queue.Queue()
 response_queue = queue.Queue()
 
+def recognized_name(text):
+    """Name greeted in a recognition response, or None"""
+    if "Hello" in text and "your attendance has been marked" in text:
+        return text.split("Hello ")[1].split(",")[0]
+    return None
+
 class AttendanceClient:
-    def __init__(self, root):
+    def __init__(self, root, camera=None, microphone=None):
         self.root = root
+        # Devices can be replaced, e.g. with the fake_devices ones: camera
+        # like cv2.VideoCapture, microphone like an open PyAudio input stream
+        self.camera = camera
+        self.microphone = microphone
         self.root.title("Attendance System")
         
         # Get screen dimensions
@@ -70,6 +144,9 @@ class AttendanceClient:
         # Create left frame for video
         self.left_frame = ttk.Frame(main_frame)
         self.left_frame.pack(side="left", fill="both", expand=True, padx=10, pady=10)
+        # The preview is sized to fit this frame, so the frame must not
+        # grow with the preview or it would squeeze the right-hand panel
+        self.left_frame.pack_propagate(False)
         
         # Create label for displaying camera feed
         self.video_label = ttk.Label(self.left_frame)
@@ -106,6 +183,10 @@ class AttendanceClient:
         self.response_text.insert("1.0", "No responses yet")
         self.response_text.config(state="disabled")
         
+        # Face tracks, shared by the FrameSender and the response dispatcher
+        self.face_tracker = FaceTracker(TRACK_IOU_THRESHOLD, TRACK_MAX_AGE, RESOLVED_TTL,
+                                        retry=TRACK_RETRY, max_retry=TRACK_MAX_RETRY)
+        
         # Initialize camera
         self.init_camera()
         
@@ -114,40 +195,118 @@ class AttendanceClient:
         
         # Initialize audio
         self.init_audio()
+        # Voice commands are sent as they are recorded, see uplink.VoiceRecorder
+        self.voice = VoiceRecorder(self.send_message, RATE, CHANNELS,
+                                   pyaudio.get_sample_size(AUDIO_FORMAT), CHUNK,
+                                   stream=STREAM_VOICE,
+                                   vad_threshold=VAD_THRESHOLD if VAD_ENABLED else None)
         
         # Initialize pygame for audio playback
         pygame.mixer.init()
+        # Speech gets its own channel so a new response replaces the previous one
+        pygame.mixer.set_reserved(1)
+        self.speech_channel = pygame.mixer.Channel(0)
+        # The end of playback arrives as a SPEECH_DONE event. pygame only has an
+        # event queue with its display initialized; no window is opened
+        os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+        pygame.display.init()
+        self.speech_channel.set_endevent(SPEECH_DONE)
+        self.speech_cache = SpeechCache(TTS_CACHE_SIZE, TTS_VOICE, TTS_SPEED)
+        self.speech_cache.prewarm(TTS_PREWARM_PHRASES)
+        
+        # End-to-end latency and loss, from the stamps echoed in replies;
+        # kill -USR1 <pid> prints the histograms
+        frame_monitor = StreamMonitor('frame')
+        audio_monitor = StreamMonitor('audio')
+        self.monitors = {
+            protocol.MSG_FRAME: frame_monitor,
+            protocol.MSG_FACES: frame_monitor,
+            protocol.MSG_AUDIO: audio_monitor,
+            protocol.MSG_AUDIO_CHUNK: audio_monitor,
+        }
+        signal.signal(signal.SIGUSR1, lambda sig, frame: dump_all(set(self.monitors.values())))
+        
+        self.init_metrics()
+        
+        # Preview buffers, allocated again only when the label is resized
+        self.preview_size = None
+        self.preview_scaled = None
+        self.preview_pil = None
+        self.preview_image = None
+        self.preview_rendered = 0
+        self.preview_render_time = 0.0
+        
+        # Responses waiting for the Tk loop, see dispatch_responses()
+        self.pending_responses = []
+        self.pending_lock = threading.Lock()
+        self.redraw_scheduled = False
+        self.responses_shown = 0
+        self.redraws = 0
         
         # Start update loop
         self.update()
         
         # Start response processing loop
-        response_thread = threading.Thread(target=self.process_responses)
+        response_thread = threading.Thread(target=self.dispatch_responses)
         response_thread.daemon = True
         response_thread.start()
     
     def init_camera(self):
         try:
             # Try different camera indices for Raspberry Pi
-            camera_indices = [0, -1, 2, 1]
+            camera_indices = [0, -1, 2, 1] if self.camera is None else [None]
             for idx in camera_indices:
-                self.cap = cv2.VideoCapture(idx)
+                self.cap = cv2.VideoCapture(idx) if idx is not None else self.camera
                 if self.cap.isOpened():
                     print(f"Camera opened successfully on index {idx}")
-                    self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, CAMERA_WIDTH)
-                    self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, CAMERA_HEIGHT)
+                    if EDGE_DETECTION:
+                        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, EDGE_CAMERA_WIDTH)
+                        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, EDGE_CAMERA_HEIGHT)
+                    else:
+                        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, CAMERA_WIDTH)
+                        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, CAMERA_HEIGHT)
                     self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
                     break
             
             if not self.cap.isOpened():
                 self.status_label.config(text="Error: Could not open camera")
                 print("Error: Could not open camera")
+                return
+            
+            # One thread owns the device; preview and sender read the latest frame
+            self.frames = FrameBroker(self.cap)
+            self.preview_frames = self.frames.subscribe('preview')
+            self.sender_frames = self.frames.subscribe('sender')
+            self.frames.start()
                 
         except Exception as e:
             self.status_label.config(text=f"Camera error: {str(e)}")
             print(f"Camera error: {str(e)}")
     
+    def init_metrics(self):
+        registry = metrics.REGISTRY
+        if hasattr(self, 'frames'):
+            registry.add_stats('camera', self.frames.stats,
+                               counters=('captured', 'read_failures', 'read', 'dropped', 'skipped'))
+        registry.add_stats('preview', self.preview_stats, counters=('rendered',))
+        registry.add_stats('voice', self.voice.stats, counters=('utterances', 'chunks_sent'))
+        registry.add_stats('speech_cache', self.speech_cache.stats, counters=('hits', 'misses'))
+        registry.add_stats('responses', self.response_stats, counters=('shown', 'redraws'))
+        for stream, monitor in ((protocol.MSG_FRAME, 'frame'), (protocol.MSG_AUDIO_CHUNK, 'audio')):
+            registry.add_stats(f'echo_{monitor}', self.monitors[stream].stats,
+                               counters=('received', 'lost', 'reordered', 'duplicates'))
+        if METRICS_PORT:
+            try:
+                metrics.serve(METRICS_PORT)
+                print(f"Metrics on port {METRICS_PORT}")
+            except OSError as e:
+                print(f"Metrics server error: {e}")
+    
     def init_audio(self):
+        if self.microphone is not None:
+            self.recording = False
+            return
+        
         try:
             self.audio = pyaudio.PyAudio()
             
@@ -179,12 +338,16 @@ class AttendanceClient:
             try:
                 self.client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
                 self.client_socket.connect((SERVER_IP, SERVER_PORT))
+                self.send_lock = threading.Lock()
                 self.status_label.config(text="Connected to server")
                 print("Connected to server")
                 
-                self.send_thread = threading.Thread(target=self.send_frames)
-                self.send_thread.daemon = True
-                self.send_thread.start()
+                # Responses are read on their own thread, independent of sending
+                self.receiver = ResponseReceiver(self.client_socket, response_queue.put)
+                self.receiver.start()
+                
+                if hasattr(self, 'sender_frames'):
+                    self.start_sender()
                 return
                 
             except Exception as e:
@@ -195,98 +358,70 @@ class AttendanceClient:
         self.status_label.config(text="Connection failed")
         print("Failed to connect after multiple attempts")
     
-    def send_frames(self):
-        last_sent_time = 0
-        
-        while running:
+    def send_message(self, message):
+        # Frames and voice commands are sent from different threads
+        with self.send_lock:
+            with SEND_TIME.time():
+                self.client_socket.sendall(message)
+        BYTES_SENT.inc(len(message))
+    
+    def start_sender(self):
+        """Upload frames from the camera on the FrameSender's thread"""
+        change_gate = ChangeGate(threshold=CHANGE_THRESHOLD,
+                                 cooldown=CHANGE_COOLDOWN,
+                                 keepalive=KEEPALIVE_INTERVAL)
+        metrics.REGISTRY.add_stats('change_gate', change_gate.stats,
+                                   counters=('sent', 'suppressed'))
+        face_detector = None
+        if EDGE_DETECTION:
             try:
-                # Send frame every 1 second to reduce load
-                current_time = time.time()
-                if current_time - last_sent_time >= 1:
-                    ret, frame = self.cap.read()
-                    if ret:
-                        # Resize frame for network efficiency
-                        small_frame = cv2.resize(frame, (320, 240))
-                        
-                        # Prepare message
-                        message = {
-                            'type': 'frame',
-                            'data': pickle.dumps(small_frame)
-                        }
-                        
-                        # Send message
-                        message_bytes = pickle.dumps(message)
-                        size = len(message_bytes).to_bytes(4, byteorder='big')
-                        self.client_socket.sendall(size + message_bytes)
-                        
-                        last_sent_time = current_time
-                
-                # Process any response from server
-                try:
-                    header = self.client_socket.recv(4, socket.MSG_DONTWAIT)
-                    if header:
-                        size = int.from_bytes(header, byteorder='big')
-                        data = b''
-                        while len(data) < size:
-                            packet = self.client_socket.recv(size - len(data))
-                            if not packet:
-                                break
-                            data += packet
-                        
-                        if data:
-                            response = pickle.loads(data)
-                            response_queue.put(response)
-                except BlockingIOError:
-                    # No data available
-                    pass
-                except Exception as e:
-                    print(f"Error receiving data: {e}")
-                
-                time.sleep(0.1)  # Small sleep to prevent high CPU usage
-                
+                face_detector = FaceDetector()
+                metrics.REGISTRY.add_stats('faces', face_detector.stats,
+                                           counters=('frames', 'empty', 'faces'))
+                metrics.REGISTRY.add_stats('face_tracks', self.face_tracker.stats,
+                                           counters=('started', 'uploaded', 'avoided'))
             except Exception as e:
-                print(f"Error in send_frames: {e}")
-                time.sleep(1)  # Wait before retrying
+                print(f"Face detection unavailable, sending whole frames: {e}")
+        
+        self.sender = FrameSender(self.sender_frames, self.send_message, change_gate,
+                                  check_interval=FRAME_CHECK_INTERVAL,
+                                  jpeg_quality=JPEG_QUALITY,
+                                  size=(CAMERA_WIDTH, CAMERA_HEIGHT),
+                                  face_detector=face_detector,
+                                  face_tracker=self.face_tracker,
+                                  face_quality=FACE_JPEG_QUALITY)
+        metrics.REGISTRY.add_stats('frame_sender', self.sender.stats, counters=('checked', 'sent'))
+        self.sender.start()
+    
+    def open_microphone(self):
+        if self.microphone is not None:
+            return self.microphone
+        return self.audio.open(format=AUDIO_FORMAT,
+                               channels=CHANNELS,
+                               rate=RATE,
+                               input=True,
+                               frames_per_buffer=CHUNK)
     
     def start_recording(self, event):
-        if not hasattr(self, 'audio'):
+        if self.microphone is None and not hasattr(self, 'audio'):
             self.status_label.config(text="Audio not initialized")
             return
         
         self.recording = True
         self.status_label.config(text="Recording...")
+        self.utterance_id = getattr(self, 'utterance_id', 0) + 1
+        utterance_id = self.utterance_id
         
         def record_audio():
             try:
-                stream = self.audio.open(format=AUDIO_FORMAT,
-                                      channels=CHANNELS,
-                                      rate=RATE,
-                                      input=True,
-                                      frames_per_buffer=CHUNK)
-                
-                frames = []
-                
-                while self.recording:
-                    data = stream.read(CHUNK, exception_on_overflow=False)
-                    frames.append(data)
-                
-                stream.stop_stream()
-                stream.close()
-                
-                # Convert audio data to bytes
-                audio_data = b''.join(frames)
-                
-                # Put audio data in queue
-                message = {
-                    'type': 'audio',
-                    'data': audio_data,
-                    'user_id': getattr(self, 'current_user_id', None)
-                }
-                
-                # Send audio to server
-                message_bytes = pickle.dumps(message)
-                size = len(message_bytes).to_bytes(4, byteorder='big')
-                self.client_socket.sendall(size + message_bytes)
+                stream = self.open_microphone()
+                try:
+                    self.voice.record(stream, utterance_id, lambda: self.recording,
+                                      getattr(self, 'current_user_id', None))
+                finally:
+                    if stream is not self.microphone:
+                        stream.stop_stream()
+                        stream.close()
                 
             except Exception as e:
                 print(f"Error recording audio: {e}")
@@ -299,87 +434,204 @@ class AttendanceClient:
         self.recording = False
         self.status_label.config(text="Processing...")
     
-    def process_responses(self):
+    def dispatch_responses(self):
+        """Hand responses to the Tk loop as they arrive
+
+        Runs on its own thread, blocked on the queue. Echoes are recorded
+        and speech is synthesized here; everything that touches widgets or
+        plays runs in show_responses() on the Tk thread. Responses arriving
+        while a redraw is pending join it.
+        """
         while running:
             try:
-                if not response_queue.empty():
-                    response = response_queue.get()
-                    response_type = response.get('type')
-                    
-                    if response_type == 'speech':
-                        text = response.get('text', '')
-                        
-                        # Update response text in UI
-                        self.response_text.config(state="normal")
-                        self.response_text.delete("1.0", "end")
-                        self.response_text.insert("1.0", text)
-                        self.response_text.config(state="disabled")
-                        
-                        # Convert text to speech
-                        self.speak_text(text)
-                        
-                        # Extract user ID if present in response
-                        if "Hello" in text and "your attendance has been marked" in text:
-                            name = text.split("Hello ")[1].split(",")[0]
-                            self.recognition_label.config(text=f"Recognized: {name}")
-                    
-                    response_queue.task_done()
-                
-                time.sleep(0.1)
+                batch = [response_queue.get(timeout=1)]
+            except queue.Empty:
+                continue
+            # Take whatever else has arrived, so a burst is synthesized once
+            while True:
+                try:
+                    batch.append(response_queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                received = time.monotonic()
+                speech = []
+                for response in batch:
+                    echo = response.get('echo')
+                    if echo:
+                        self.record_echo(echo)
+                    if response.get('type') == 'speech':
+                        if (echo and echo.get('stream') == protocol.MSG_FACES
+                                and recognized_name(response.get('text', ''))):
+                            self.face_tracker.resolve(echo.get('seq'))
+                        speech.append(response)
+                if speech:
+                    # Only the newest response is spoken, see show_responses()
+                    sound = self.speech_sound(speech[-1].get('text', ''))
+                    self.post_responses([(received, response, None) for response in speech[:-1]]
+                                        + [(received, speech[-1], sound)])
             except Exception as e:
                 print(f"Error processing responses: {e}")
-                time.sleep(1)
+            finally:
+                for _ in batch:
+                    response_queue.task_done()
     
-    def speak_text(self, text):
+    def speech_sound(self, text):
+        """Synthesized speech for text, or None; may run espeak, so not on the Tk thread"""
         try:
-            # Simple TTS using gTTS (Google Text-to-Speech)
-            # We'll use a very basic approach to avoid dependencies
-            
-            # Save response to a temporary WAV file using sox
-            with open('response.txt', 'w') as f:
-                f.write(text)
-            
-            os.system(f'espeak -f response.txt -w response.wav')
-            
-            # Play the audio file
-            pygame.mixer.music.load('response.wav')
-            pygame.mixer.music.play()
-            
-            # Clean up the file after playing
-            def cleanup():
-                while pygame.mixer.music.get_busy():
-                    time.sleep(0.1)
-                try:
-                    os.remove('response.txt')
-                    os.remove('response.wav')
-                except:
-                    pass
+            return self.speech_cache.get(text)
+        except Exception as e:
+            print(f"Error in TTS: {e}")
+            return None
+    
+    def post_responses(self, items):
+        """Queue (received time, response, sound) items for show_responses()"""
+        with self.pending_lock:
+            self.pending_responses.extend(items)
+            if self.redraw_scheduled:
+                return
+            self.redraw_scheduled = True
+        try:
+            self.root.after(0, self.show_responses)
+        except Exception as e:
+            # E.g. the Tk loop is not running yet; the next response retries
+            print(f"Error scheduling responses: {e}")
+            with self.pending_lock:
+                self.redraw_scheduled = False
+    
+    def show_responses(self):
+        """Draw every pending response in one pass; runs on the Tk thread"""
+        with self.pending_lock:
+            pending = self.pending_responses
+            self.pending_responses = []
+            self.redraw_scheduled = False
+        if not pending:
+            return
+        try:
+            # Only the newest text stays on screen and a new response cuts off
+            # the previous one's speech, so only the newest is drawn and spoken
+            received, response, sound = pending[-1]
+            text = response.get('text', '')
+            self.response_text.config(state="normal")
+            self.response_text.delete("1.0", "end")
+            self.response_text.insert("1.0", text)
+            self.response_text.config(state="disabled")
             
-            cleanup_thread = threading.Thread(target=cleanup)
-            cleanup_thread.daemon = True
-            cleanup_thread.start()
+            # Extract user ID if present in response
+            for _, response, _ in reversed(pending):
+                name = recognized_name(response.get('text', ''))
+                if name:
+                    self.recognition_label.config(text=f"Recognized: {name}")
+                    break
             
+            if sound is not None:
+                self.speak(sound, received)
         except Exception as e:
-            print(f"Error in TTS: {e}")
+            print(f"Error processing responses: {e}")
+        
+        now = time.monotonic()
+        for queued, _, _ in pending:
+            DISPATCH_TIME.observe(now - queued)
+        self.responses_shown += len(pending)
+        self.redraws += 1
+    
+    def response_stats(self):
+        return {
+            'queued': response_queue.qsize(),
+            'shown': self.responses_shown,
+            'redraws': self.redraws,
+        }
+    
+    def poll_playback(self):
+        """Handle pygame's playback events; runs on the Tk thread"""
+        for event in pygame.event.get():
+            if event.type == SPEECH_DONE and not self.speech_channel.get_busy():
+                self.status_label.config(text="Ready")
+    
+    def record_echo(self, echo):
+        monitor = self.monitors.get(echo.get('stream'))
+        if monitor is None:
+            return
+        # Audio sequence numbers restart with every utterance, so only
+        # frames are checked for loss
+        seq = echo.get('seq') if echo['stream'] in (protocol.MSG_FRAME, protocol.MSG_FACES) else None
+        monitor.record(seq, echo['timestamp'])
+    
+    def speak(self, sound, received):
+        """Play synthesized speech; runs on the Tk thread"""
+        self.speech_channel.play(sound)
+        SPEECH_TIME.observe(time.monotonic() - received)
+        self.status_label.config(text="Speaking...")
+    
+    def preview_fit(self, frame):
+        """Largest size with the frame's aspect ratio that fits the video area"""
+        frame_height, frame_width = frame.shape[:2]
+        # Measure the container: the label's own size follows its image
+        width = self.left_frame.winfo_width()
+        height = self.left_frame.winfo_height()
+        if self.preview_size is not None:
+            # Leave room for the label's padding and border around the image
+            width -= max(0, self.video_label.winfo_reqwidth() - self.preview_size[0])
+            height -= max(0, self.video_label.winfo_reqheight() - self.preview_size[1])
+        if width < 2 or height < 2:
+            # Not laid out yet
+            return frame_width, frame_height
+        scale = min(width / frame_width, height / frame_height)
+        return max(1, int(frame_width * scale)), max(1, int(frame_height * scale))
+    
+    def render_preview(self, frame):
+        start = time.monotonic()
+        size = self.preview_fit(frame)
+        if size != self.preview_size:
+            # One PhotoImage per label size; every frame is pasted into it
+            self.preview_size = size
+            self.preview_scaled = np.empty((size[1], size[0], 3), dtype=np.uint8)
+            self.preview_pil = Image.new('RGB', size)
+            self.preview_image = ImageTk.PhotoImage('RGB', size)
+            self.video_label.config(image=self.preview_image)
+            self.video_label.image = self.preview_image
+        
+        # Scale straight from the captured frame into the preallocated buffer,
+        # then let PIL swap BGR to RGB while copying it into its image
+        if frame.shape[1::-1] == size:
+            scaled = frame
+        else:
+            scaled = cv2.resize(frame, size, dst=self.preview_scaled,
+                                interpolation=cv2.INTER_AREA)
+        self.preview_pil.frombytes(np.ascontiguousarray(scaled), 'raw', 'BGR')
+        self.preview_image.paste(self.preview_pil)
+        
+        elapsed = time.monotonic() - start
+        RENDER_TIME.observe(elapsed)
+        self.preview_rendered += 1
+        self.preview_render_time += elapsed
+    
+    def preview_stats(self):
+        rendered = self.preview_rendered
+        return {
+            'rendered': rendered,
+            'render_ms': 1000 * self.preview_render_time / rendered if rendered else 0.0,
+        }
     
     def update(self):
+        start = time.monotonic()
         try:
-            if hasattr(self, 'cap') and self.cap.isOpened():
-                ret, frame = self.cap.read()
-                if ret:
-                    # Convert frame to a format tkinter can display
-                    frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                    img = Image.fromarray(frame)
-                    img = ImageTk.PhotoImage(image=img)
-                    
-                    # Update the image in the label
-                    self.video_label.config(image=img)
-                    self.video_label.image = img
+            if hasattr(self, 'frames'):
+                # None unless a frame arrived since the last redraw
+                frame = self.preview_frames.latest()
+                if frame is not None:
+                    self.render_preview(frame)
         except Exception as e:
             print(f"Error updating frame: {e}")
         
-        # Schedule the next update
-        self.root.after(33, self.update)  # ~30 FPS
+        try:
+            self.poll_playback()
+        except Exception as e:
+            print(f"Error polling playback: {e}")
+        
+        # Schedule the next update, holding PREVIEW_FPS whatever the render time
+        delay = 1.0 / PREVIEW_FPS - (time.monotonic() - start)
+        self.root.after(max(1, int(delay * 1000)), self.update)
 
 def main():
     global running
@@ -5,10 +5,17 @@ import threading
 import time
 import os
 import json
+import queue
 import requests
 import pyaudio
 import numpy as np
 from flask import Flask, Response, request
+from congestion import AdaptiveController
+from capture_hub import CaptureHub
+from uploader import FrameUploader
+from audio_hub import AudioHub, wav_header
+from player import StreamPlayer
+import metrics
 
 # Configuration
 SERVER_IP = '192.168.1.100'  # Change to your laptop's IP
@@ -18,10 +25,22 @@ CHANNELS = 1
 RATE = 16000
 CHUNK = 1024
 PI_ID = "main_entrance"  # Identifier for this Pi
+# Adaptive streaming: quality, resolution and frame rate are lowered
+# between these bounds when uploads take longer than TARGET_LATENCY
+TARGET_LATENCY = 0.3
+JPEG_QUALITY_MIN = 15
+JPEG_QUALITY_MAX = 50
+FPS_MIN = 2
+FPS_MAX = 10
 
 # Initialize Flask app
 app = Flask(__name__)
 
+controller = AdaptiveController(TARGET_LATENCY,
+                                min_quality=JPEG_QUALITY_MIN,
+                                max_quality=JPEG_QUALITY_MAX,
+                                min_fps=FPS_MIN, max_fps=FPS_MAX)
+
 # Initialize camera
 def init_camera():
     try:
@@ -33,6 +52,10 @@ def init_camera():
         print(f"Camera initialization error: {e}")
         return None
 
+# Shared camera: one capture/encode thread for all viewers, uploads on their own thread
+uploader = FrameUploader(f"http://{SERVER_IP}:{SERVER_PORT}/process_frame", PI_ID, controller)
+hub = CaptureHub(init_camera, controller, on_frame=uploader.submit)
+
 # Initialize audio
 def init_audio():
     try:
@@ -45,44 +68,31 @@ def init_audio():
         print(f"Audio initialization error: {e}")
         return None, None
 
+# Shared microphone: one capture thread, each listener reads from a ring buffer
+audio_hub = AudioHub(init_audio, CHUNK, RATE, CHANNELS)
+
+# In-process player for responses; playback starts while the upload is still arriving
+player = StreamPlayer()
+
 # Generate camera frames
-def generate_frames(camera):
-    while True:
-        try:
-            success, frame = camera.read()
-            if not success:
-                print("Failed to get frame")
-                time.sleep(0.1)
+def generate_frames(viewer):
+    try:
+        while True:
+            frame_bytes = viewer.wait_next(timeout=1.0)
+            if frame_bytes is None:
                 continue
-                
-            # Encode frame to JPEG
-            ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 30])
-            frame_bytes = buffer.tobytes()
-            
-            # Send frame to server for processing
-            try:
-                requests.post(f"http://{SERVER_IP}:{SERVER_PORT}/process_frame",
-                             files={"frame": frame_bytes},
-                             data={"pi_id": PI_ID})
-            except requests.exceptions.RequestException:
-                pass  # Continue even if the server is temporarily unavailable
-                
             # Stream to dashboard
             yield (b'--frame\r\n'
                    b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
-                   
-            time.sleep(0.1)  # Reduce framerate to save bandwidth
-        except Exception as e:
-            print(f"Frame generation error: {e}")
-            time.sleep(0.5)
+    finally:
+        hub.unsubscribe(viewer)
 
 # Flask route for video streaming
 @app.route('/video_feed')
 def video_feed():
     try:
-        camera = init_camera()
-        if camera:
-            return Response(generate_frames(camera),
+        if hub.camera:
+            return Response(generate_frames(hub.subscribe()),
                           mimetype='multipart/x-mixed-replace; boundary=frame')
         else:
             return "Camera not available", 500
@@ -93,50 +103,86 @@ def video_feed():
 # Flask route for audio streaming
 @app.route('/audio_feed', methods=['GET'])
 def audio_feed():
+    if not audio_hub.running:
+        return "Audio not available", 500
+    
+    # ?format=raw streams bare PCM described by the mimetype instead of WAV
+    raw = request.args.get('format') == 'raw'
+    listener = audio_hub.listen()
+    
     def generate_audio():
-        audio, stream = init_audio()
-        if not audio or not stream:
-            return
-            
         try:
+            if not raw:
+                yield wav_header(RATE, CHANNELS, 2)
             while True:
-                data = stream.read(CHUNK, exception_on_overflow=False)
-                yield data
-        except Exception as e:
-            print(f"Audio streaming error: {e}")
+                data = listener.read()
+                if data:
+                    yield data
         finally:
-            if stream:
-                stream.stop_stream()
-                stream.close()
-            if audio:
-                audio.terminate()
-                
+            listener.close()
+    
+    if raw:
+        return Response(generate_audio(), mimetype=f"audio/L16;rate={RATE};channels={CHANNELS}")
     return Response(generate_audio(), mimetype="audio/x-wav")
 
+@app.route('/audio_status')
+def audio_status():
+    return json.dumps(audio_hub.stats())
+
 # Receive audio responses from server
 @app.route('/play_audio', methods=['POST'])
 def play_audio():
     try:
-        # This endpoint receives audio data from the server to play through speakers
-        # Implementation depends on how you want to handle audio output
-        # For simplicity, you might save to a file and play with a system command
-        audio_data = request.data
-        with open('response.wav', 'wb') as f:
-            f.write(audio_data)
-        os.system('aplay response.wav')  # Simple playback
-        return "OK", 200
+        clip = player.create_clip()
+    except queue.Full:
+        return "Playback queue full", 503
+    
+    try:
+        # Feed the WAV body to the player as it arrives; playback does not
+        # wait for the whole upload and the request does not wait for playback
+        while True:
+            chunk = request.stream.read(4096)
+            if not chunk:
+                break
+            clip.feed(chunk)
+        clip.finish()
+        return json.dumps({"playback_id": clip.id}), 202
     except Exception as e:
         print(f"Play audio error: {e}")
+        clip.fail(str(e))
         return str(e), 500
 
+@app.route('/play_audio/<int:playback_id>')
+def play_audio_status(playback_id):
+    status = player.status(playback_id)
+    if status is None:
+        return "Unknown playback id", 404
+    return json.dumps(status)
+
 # Health check endpoint
 @app.route('/status')
 def status():
     return json.dumps({"status": "online", "pi_id": PI_ID})
 
+# Pipeline metrics in the Prometheus text format
+metrics.REGISTRY.add_stats('camera', hub.stats, counters=('captured', 'read_failures'))
+metrics.REGISTRY.add_stats('upload', uploader.stats, counters=('sent', 'failed', 'dropped'))
+metrics.REGISTRY.add_stats('controller', controller.settings)
+metrics.REGISTRY.add_stats('audio', audio_hub.stats, counters=('overruns',))
+metrics.REGISTRY.add_stats('player', player.stats)
+
+@app.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
+
 # Main function
 def main():
     try:
+        uploader.start()
+        hub.start()
+        audio_hub.start()
+        player.start()
+        
         # Start Flask server
         app.run(host='0.0.0.0', port=8000, threaded=True)
     except Exception as e:
@@ -0,0 +1,146 @@
+# Identical copies live in client/ and raspberry_pi/, which are
+# each deployed on their own; change them together.
+import fcntl
+import struct
+import termios
+import time
+import cv2
+
+
+def unsent_bytes(sock):
+    """Bytes still waiting in the socket's send buffer (Linux), 0 if unknown"""
+    try:
+        result = fcntl.ioctl(sock.fileno(), termios.TIOCOUTQ, struct.pack('i', 0))
+        return struct.unpack('i', result)[0]
+    except (OSError, AttributeError):
+        return 0
+
+
+class AdaptiveController:
+    """Adjust JPEG quality, resolution and frame rate to hold a target latency
+
+    Latency samples come from send-side backpressure (time blocked in
+    sendall plus the time needed to drain the socket send buffer) or from
+    acknowledgement round trips when the receiver provides them. When the
+    smoothed latency is above target the controller lowers quality first,
+    then resolution, then frame rate; after a run of samples well below
+    target it restores them in reverse order.
+    """
+
+    def __init__(self, target_latency=0.2, min_quality=30, max_quality=85,
+                 quality_step=10, scales=(1.0, 0.75, 0.5), min_fps=5, max_fps=30,
+                 smoothing=0.3, recovery_samples=30, hold_samples=5):
+        self.target_latency = target_latency
+        self.min_quality = min_quality
+        self.max_quality = max_quality
+        self.quality_step = quality_step
+        self.scales = scales
+        self.min_fps = min_fps
+        self.max_fps = max_fps
+        self.smoothing = smoothing
+        self.recovery_samples = recovery_samples
+        self.hold_samples = hold_samples
+
+        self.quality = max_quality
+        self.scale_index = 0
+        self.fps = max_fps
+        self.latency = 0.0
+        self.rtt = None
+        self.good_samples = 0
+        self.hold = 0
+        self.drain_rate = None
+        self.last_send = None
+
+    @property
+    def scale(self):
+        return self.scales[self.scale_index]
+
+    @property
+    def frame_interval(self):
+        return 1.0 / self.fps
+
+    def resize(self, frame):
+        if self.scale >= 1.0:
+            return frame
+        return cv2.resize(frame, None, fx=self.scale, fy=self.scale,
+                          interpolation=cv2.INTER_AREA)
+
+    def observe_send(self, blocked, size, unsent, now=None):
+        """Record one send: seconds blocked, bytes sent and bytes left unsent"""
+        if now is None:
+            now = time.monotonic()
+        if self.last_send is not None:
+            last_time, last_unsent = self.last_send
+            elapsed = now - last_time
+            drained = last_unsent + size - unsent
+            if elapsed > 0 and drained > 0:
+                rate = drained / elapsed
+                if self.drain_rate is None:
+                    self.drain_rate = rate
+                else:
+                    self.drain_rate += self.smoothing * (rate - self.drain_rate)
+        self.last_send = (now, unsent)
+
+        latency = blocked
+        if unsent and self.drain_rate:
+            latency += unsent / self.drain_rate
+        if self.rtt is not None:
+            latency = max(latency, self.rtt)
+        self.observe_latency(latency)
+
+    def observe_rtt(self, rtt):
+        """Record an acknowledgement round-trip time"""
+        if self.rtt is None:
+            self.rtt = rtt
+        else:
+            self.rtt += self.smoothing * (rtt - self.rtt)
+
+    def observe_latency(self, latency):
+        self.latency += self.smoothing * (latency - self.latency)
+        if self.hold:
+            # Let the last adjustment take effect before judging it
+            self.hold -= 1
+            return
+
+        if self.latency > self.target_latency:
+            self.good_samples = 0
+            if self._degrade():
+                self.hold = self.hold_samples
+        elif self.latency < self.target_latency / 2:
+            self.good_samples += 1
+            if self.good_samples >= self.recovery_samples:
+                self.good_samples = 0
+                if self._improve():
+                    self.hold = self.hold_samples
+        else:
+            self.good_samples = 0
+
+    def _degrade(self):
+        if self.quality > self.min_quality:
+            self.quality = max(self.min_quality, self.quality - self.quality_step)
+        elif self.scale_index < len(self.scales) - 1:
+            self.scale_index += 1
+        elif self.fps > self.min_fps:
+            self.fps = max(self.min_fps, self.fps * 3 // 4)
+        else:
+            return False
+        return True
+
+    def _improve(self):
+        if self.fps < self.max_fps:
+            self.fps = min(self.max_fps, self.fps * 4 // 3 + 1)
+        elif self.scale_index > 0:
+            self.scale_index -= 1
+        elif self.quality < self.max_quality:
+            self.quality = min(self.max_quality, self.quality + self.quality_step)
+        else:
+            return False
+        return True
+
+    def settings(self):
+        return {
+            'quality': self.quality,
+            'scale': self.scale,
+            'fps': self.fps,
+            'latency': self.latency,
+        }
@@ -0,0 +1,59 @@
+import os
+import cv2
+
+CASCADE = 'haarcascade_frontalface_default.xml'
+
+
+class FaceDetector:
+    """Haar cascade face detection on a small grayscale copy of the frame
+
+    Boxes are scaled back to the frame's own resolution and padded by
+    `margin` of their size on every side, clamped to the frame, so crops
+    keep some context around the face for the recognizer.
+    """
+
+    def __init__(self, detect_width=320, min_size=24, margin=0.2,
+                 scale_factor=1.1, min_neighbors=5, cascade_path=None):
+        if cascade_path is None:
+            cascade_path = os.path.join(cv2.data.haarcascades, CASCADE)
+        self.cascade = cv2.CascadeClassifier(cascade_path)
+        if self.cascade.empty():
+            raise RuntimeError(f"Could not load face cascade {cascade_path}")
+        self.detect_width = detect_width
+        self.min_size = min_size
+        self.margin = margin
+        self.scale_factor = scale_factor
+        self.min_neighbors = min_neighbors
+        self.frames = 0
+        self.empty = 0
+        self.faces = 0
+
+    def detect(self, frame):
+        """Return the (x, y, w, h) boxes of the faces in frame"""
+        height, width = frame.shape[:2]
+        scale = min(1.0, self.detect_width / width)
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+        if scale < 1.0:
+            gray = cv2.resize(gray, (int(width * scale), int(height * scale)),
+                              interpolation=cv2.INTER_AREA)
+        found = self.cascade.detectMultiScale(
+            gray, scaleFactor=self.scale_factor, minNeighbors=self.min_neighbors,
+            minSize=(self.min_size, self.min_size))
+
+        boxes = []
+        for x, y, w, h in found:
+            pad_x, pad_y = w * self.margin, h * self.margin
+            left = max(0, int((x - pad_x) / scale))
+            top = max(0, int((y - pad_y) / scale))
+            right = min(width, int((x + w + pad_x) / scale))
+            bottom = min(height, int((y + h + pad_y) / scale))
+            boxes.append((left, top, right - left, bottom - top))
+
+        self.frames += 1
+        self.faces += len(boxes)
+        if not boxes:
+            self.empty += 1
+        return boxes
+
+    def stats(self):
+        return {'frames': self.frames, 'empty': self.empty, 'faces': self.faces}
@@ -0,0 +1,143 @@
+import collections
+import itertools
+import threading
+import time
+
+
+def iou(a, b):
+    """Intersection over union of two (x, y, w, h) boxes"""
+    left = max(a[0], b[0])
+    top = max(a[1], b[1])
+    right = min(a[0] + a[2], b[0] + b[2])
+    bottom = min(a[1] + a[3], b[1] + b[3])
+    if right <= left or bottom <= top:
+        return 0.0
+    overlap = (right - left) * (bottom - top)
+    return overlap / (a[2] * a[3] + b[2] * b[3] - overlap)
+
+
+class FaceTracker:
+    """Keep ids for faces across frames and remember which the server resolved
+
+    Each frame's boxes are matched greedily to the live tracks by IoU; a
+    box without a match starts a new track, and a track unseen for
+    `max_age` seconds is dropped. Face messages are recorded with the
+    tracks they carried; once the server recognizes a message, its tracks
+    are resolved and not uploaded again for `resolved_ttl` seconds.
+    Until then a track is due() again `retry` seconds after its last
+    upload, the wait doubling with each unanswered upload up to `max_retry`.
+    """
+
+    def __init__(self, iou_threshold=0.3, max_age=2.0, resolved_ttl=300.0, max_pending=64,
+                 retry=1.0, max_retry=30.0):
+        self.iou_threshold = iou_threshold
+        self.max_age = max_age
+        self.resolved_ttl = resolved_ttl
+        self.retry = retry
+        self.max_retry = max_retry
+        self.ids = itertools.count(1)
+        # track id -> (box, last seen)
+        self.tracks = {}
+        # track id -> time its resolution expires
+        self.resolved = {}
+        # track id -> (uploads since the last resolution, last upload time)
+        self.attempts = {}
+        # message seq -> track ids, oldest first
+        self.pending = collections.OrderedDict()
+        self.max_pending = max_pending
+        self.lock = threading.Lock()
+        self.started = 0
+        self.uploaded = 0
+        self.avoided = 0
+
+    def update(self, boxes, now=None):
+        """Assign a track id to each box; returns a list of (track id, box)"""
+        if now is None:
+            now = time.monotonic()
+        with self.lock:
+            for track_id, (_, last_seen) in list(self.tracks.items()):
+                if now - last_seen > self.max_age:
+                    del self.tracks[track_id]
+                    self.attempts.pop(track_id, None)
+
+            pairs = sorted(((iou(box, track_box), i, track_id)
+                            for i, box in enumerate(boxes)
+                            for track_id, (track_box, _) in self.tracks.items()),
+                           reverse=True)
+            assigned = {}
+            matched = set()
+            for overlap, i, track_id in pairs:
+                if overlap < self.iou_threshold:
+                    break
+                if i in assigned or track_id in matched:
+                    continue
+                assigned[i] = track_id
+                matched.add(track_id)
+
+            faces = []
+            for i, box in enumerate(boxes):
+                track_id = assigned.get(i)
+                if track_id is None:
+                    track_id = next(self.ids)
+                    self.started += 1
+                self.tracks[track_id] = (box, now)
+                faces.append((track_id, box))
+            return faces
+
+    def select(self, faces, now=None):
+        """Return the faces whose tracks the server has not resolved"""
+        if now is None:
+            now = time.monotonic()
+        with self.lock:
+            for track_id, expires in list(self.resolved.items()):
+                if now >= expires or track_id not in self.tracks:
+                    del self.resolved[track_id]
+            selected = [face for face in faces if face[0] not in self.resolved]
+            self.avoided += len(faces) - len(selected)
+            return selected
+
+    def due(self, faces, now=None):
+        """Whether any of faces is new or has waited long enough for a retry"""
+        if now is None:
+            now = time.monotonic()
+        with self.lock:
+            for track_id, _ in faces:
+                if track_id not in self.attempts:
+                    return True
+                uploads, last_upload = self.attempts[track_id]
+                if now - last_upload >= min(self.retry * 2 ** (uploads - 1), self.max_retry):
+                    return True
+            return False
+
+    def sent(self, seq, faces, now=None):
+        """Remember which tracks the face message seq carried"""
+        if now is None:
+            now = time.monotonic()
+        with self.lock:
+            self.pending[seq] = [track_id for track_id, _ in faces]
+            self.uploaded += len(faces)
+            for track_id, _ in faces:
+                uploads, _ = self.attempts.get(track_id, (0, now))
+                self.attempts[track_id] = (uploads + 1, now)
+            while len(self.pending) > self.max_pending:
+                self.pending.popitem(last=False)
+
+    def resolve(self, seq, now=None):
+        """The server recognized message seq; stop uploading its tracks"""
+        if now is None:
+            now = time.monotonic()
+        with self.lock:
+            for track_id in self.pending.pop(seq, ()):
+                self.attempts.pop(track_id, None)
+                if track_id in self.tracks:
+                    self.resolved[track_id] = now + self.resolved_ttl
+
+    def stats(self):
+        with self.lock:
+            return {
+                'tracks': len(self.tracks),
+                'resolved': len(self.resolved),
+                'started': self.started,
+                'uploaded': self.uploaded,
+                'avoided': self.avoided,
+            }
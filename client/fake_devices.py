@@ -0,0 +1,98 @@
+import time
+import numpy as np
+
+
+def synthetic_frames(width, height, count=30, seed=0):
+    """Frames of a bar sweeping across a gradient, with sensor-like noise
+
+    Generated once and cycled, so producing a frame costs about as much
+    CPU as reading one from a real camera.
+    """
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width]
+    background = np.stack([x * 255 // width,
+                           y * 255 // height,
+                           (x + y) * 255 // (width + height)], axis=-1)
+    frames = []
+    bar = max(1, width // 10)
+    for i in range(count):
+        frame = background.copy()
+        left = i * (width - bar) // max(1, count - 1)
+        frame[:, left:left + bar] = (240, 240, 240)
+        frame += rng.integers(-8, 8, frame.shape)
+        frames.append(np.clip(frame, 0, 255).astype(np.uint8))
+    return frames
+
+
+def synthetic_speech(seconds, rate, seed=0):
+    """Harmonics with a syllable-rate envelope plus noise, as int16"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * rate)) / rate
+    pitch = 140 + 20 * np.sin(2 * np.pi * 0.5 * t)
+    phase = 2 * np.pi * np.cumsum(pitch) / rate
+    voiced = sum(np.sin(k * phase) / k for k in range(1, 8))
+    envelope = np.clip(np.sin(2 * np.pi * 3 * t), 0, None)
+    signal = 6000 * voiced * envelope + rng.normal(0, 200, len(t))
+    return np.clip(signal, -32768, 32767).astype(np.int16)
+
+
+class SyntheticCapture:
+    """Stands in for cv2.VideoCapture: read() delivers BGR frames at the camera rate"""
+
+    def __init__(self, width=640, height=480, fps=30):
+        self.frames = synthetic_frames(width, height)
+        self.interval = 1.0 / fps
+        self.index = 0
+        self.next_frame = None
+        # Capture time (time.monotonic()) of the last frame read
+        self.timestamp = 0.0
+
+    def isOpened(self):
+        return True
+
+    def set(self, prop, value):
+        return False
+
+    def read(self):
+        # Block until the next frame is due, like the real camera
+        now = time.monotonic()
+        if self.next_frame is None:
+            self.next_frame = now
+        delay = self.next_frame - now
+        if delay > 0:
+            time.sleep(delay)
+        self.next_frame = max(self.next_frame + self.interval, time.monotonic())
+        self.timestamp = time.monotonic()
+        frame = self.frames[self.index % len(self.frames)]
+        self.index += 1
+        return True, frame
+
+    def release(self):
+        pass
+
+
+class SyntheticMicrophone:
+    """Stands in for a PyAudio input stream: read() blocks for one chunk of audio"""
+
+    def __init__(self, rate=44100, seconds=5):
+        self.rate = rate
+        self.samples = synthetic_speech(seconds, rate)
+        self.position = 0
+        self.next_chunk = None
+
+    def read(self, frames, exception_on_overflow=True):
+        if self.next_chunk is None:
+            self.next_chunk = time.monotonic()
+        self.next_chunk += frames / self.rate
+        delay = self.next_chunk - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        index = (self.position + np.arange(frames)) % len(self.samples)
+        self.position = (self.position + frames) % len(self.samples)
+        return self.samples[index].tobytes()
+
+    def stop_stream(self):
+        pass
+
+    def close(self):
+        pass
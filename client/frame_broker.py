@@ -0,0 +1,136 @@
+import threading
+import time
+from metrics import REGISTRY
+
+CAPTURE_TIME = REGISTRY.timer('camera_capture_seconds', 'Time to read one frame from the camera')
+
+
+class FrameConsumer:
+    """A reader of the newest frame published by a FrameBroker"""
+
+    def __init__(self, broker, name):
+        self.broker = broker
+        self.name = name
+        self.last_seq = 0
+        # Capture time (time.monotonic()) of the last frame returned
+        self.timestamp = 0.0
+        self.frames_read = 0
+        # Frames that were replaced by a newer one before this consumer read them
+        self.dropped = 0
+        # Reads that found no frame newer than the one already returned
+        self.skipped = 0
+
+    def _take(self, seq, frame, timestamp):
+        if seq == self.last_seq:
+            self.skipped += 1
+            return None
+        if self.last_seq:
+            self.dropped += max(0, seq - self.last_seq - 1)
+        self.last_seq = seq
+        self.timestamp = timestamp
+        self.frames_read += 1
+        return frame
+
+    def latest(self):
+        """Return the newest frame if it has not been read yet, else None"""
+        seq, frame, timestamp = self.broker.snapshot()
+        if frame is None:
+            return None
+        return self._take(seq, frame, timestamp)
+
+    def wait_next(self, timeout=None):
+        """Block until a frame newer than the last one read is available"""
+        seq, frame, timestamp = self.broker.wait_newer(self.last_seq, timeout)
+        if frame is None:
+            return None
+        return self._take(seq, frame, timestamp)
+
+    def stats(self):
+        return {
+            'read': self.frames_read,
+            'dropped': self.dropped,
+            'skipped': self.skipped,
+        }
+
+
+class FrameBroker:
+    """Single capture thread sharing the newest frame with several consumers
+
+    Without a capture source the broker only fans out what is passed to
+    publish(). Frames are published into a latest-frame slot and handed out by
+    reference, so consumers must treat them as read-only.
+    """
+
+    def __init__(self, capture=None):
+        self.capture = capture
+        self.running = False
+        self.stopped = False
+        self.thread = None
+        self.condition = threading.Condition()
+        self.seq = 0
+        self.frame = None
+        self.timestamp = 0.0
+        self.consumers = {}
+        self.read_failures = 0
+
+    def subscribe(self, name):
+        consumer = FrameConsumer(self, name)
+        self.consumers[name] = consumer
+        return consumer
+
+    def unsubscribe(self, consumer):
+        self.consumers.pop(consumer.name, None)
+
+    def publish(self, frame, timestamp=None):
+        if timestamp is None:
+            timestamp = time.monotonic()
+        if hasattr(frame, 'flags'):
+            frame.flags.writeable = False
+        with self.condition:
+            self.seq += 1
+            self.frame = frame
+            self.timestamp = timestamp
+            self.condition.notify_all()
+
+    def snapshot(self):
+        with self.condition:
+            return self.seq, self.frame, self.timestamp
+
+    def wait_newer(self, seq, timeout=None):
+        with self.condition:
+            self.condition.wait_for(lambda: self.seq != seq or self.stopped, timeout)
+            if self.seq == seq:
+                return seq, None, 0.0
+            return self.seq, self.frame, self.timestamp
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._capture_loop)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+        if self.thread:
+            self.thread.join()
+
+    def stats(self):
+        return {
+            'captured': self.seq,
+            'read_failures': self.read_failures,
+            'consumers': {name: consumer.stats()
+                          for name, consumer in self.consumers.items()},
+        }
+
+    def _capture_loop(self):
+        while self.running:
+            with CAPTURE_TIME.time():
+                ret, frame = self.capture.read()
+            if not ret:
+                self.read_failures += 1
+                time.sleep(0.1)
+                continue
+            self.publish(frame)
@@ -0,0 +1,208 @@
+# Identical copies live in client/ and raspberry_pi/, which are
+# each deployed on their own; change them together.
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Prometheus text exposition format
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Upper bounds in seconds, for pipeline stage timings
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def _name(name):
+    return re.sub(r'[^a-zA-Z0-9_]', '_', name)
+
+
+def _value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(int(value))
+
+
+class Counter:
+    type = 'counter'
+
+    def __init__(self, name, help=''):
+        self.name = name
+        self.help = help
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def samples(self):
+        yield self.name + '_total', '', self.value
+
+
+class Gauge:
+    type = 'gauge'
+
+    def __init__(self, name, help=''):
+        self.name = name
+        self.help = help
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+    def samples(self):
+        yield self.name, '', self.value
+
+
+class Timer:
+    """Duration histogram of one pipeline stage, in seconds"""
+    type = 'histogram'
+
+    def __init__(self, name, help='', buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, seconds):
+        with self.lock:
+            self.count += 1
+            self.sum += seconds
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    self.counts[i] += 1
+                    break
+
+    def time(self):
+        """Context manager timing its block"""
+        return _Timing(self)
+
+    def samples(self):
+        with self.lock:
+            cumulative = 0
+            for bound, count in zip(self.buckets, self.counts):
+                cumulative += count
+                yield self.name + '_bucket', f'{{le="{bound}"}}', cumulative
+            yield self.name + '_bucket', '{le="+Inf"}', self.count
+            yield self.name + '_sum', '', self.sum
+            yield self.name + '_count', '', self.count
+
+
+class _Timing:
+    def __init__(self, timer):
+        self.timer = timer
+
+    def __enter__(self):
+        self.start = time.monotonic()
+        return self
+
+    def __exit__(self, *exc):
+        self.timer.observe(time.monotonic() - self.start)
+
+
+class Registry:
+    """Metrics of one process, rendered in the Prometheus text format
+
+    Stage timings and byte counts are recorded as they happen. Counters and
+    queue depths the components already keep are read from their stats()
+    when the metrics are rendered, see add_stats().
+    """
+
+    def __init__(self):
+        self.metrics = {}
+        self.sources = []
+        self.lock = threading.Lock()
+
+    def _get(self, cls, name, help, **kwargs):
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = cls(name, help, **kwargs)
+            return metric
+
+    def counter(self, name, help=''):
+        return self._get(Counter, name, help)
+
+    def gauge(self, name, help=''):
+        return self._get(Gauge, name, help)
+
+    def timer(self, name, help='', buckets=DEFAULT_BUCKETS):
+        return self._get(Timer, name, help, buckets=buckets)
+
+    def add_stats(self, prefix, stats, counters=()):
+        """Export the numeric values of stats() as prefix_<key> gauges
+
+        Keys listed in counters are exported as counters instead. Nested
+        dicts are flattened with their keys joined by underscores.
+        """
+        with self.lock:
+            self.sources.append((prefix, stats, set(counters)))
+
+    def _flatten(self, prefix, stats, counters):
+        for key, value in stats.items():
+            name = _name(f'{prefix}_{key}')
+            if isinstance(value, dict):
+                yield from self._flatten(name, value, counters)
+            elif isinstance(value, (int, float)):
+                if key in counters:
+                    yield name, 'counter', name + '_total', value
+                else:
+                    yield name, 'gauge', name, value
+
+    def render(self):
+        lines = []
+        with self.lock:
+            metrics = list(self.metrics.values())
+            sources = list(self.sources)
+        for metric in metrics:
+            if metric.help:
+                lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{labels} {_value(value)}')
+        for prefix, stats, counters in sources:
+            try:
+                values = list(self._flatten(prefix, stats(), counters))
+            except Exception as e:
+                print(f"Metrics: {prefix} stats failed: {e}")
+                continue
+            for name, metric_type, sample, value in values:
+                lines.append(f'# TYPE {name} {metric_type}')
+                lines.append(f'{sample} {_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+# Shared by all modules of the process
+REGISTRY = Registry()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = self.registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port, host='0.0.0.0', registry=REGISTRY):
+    """Serve /metrics from a background thread; returns the server"""
+    handler = type('MetricsHandler', (_MetricsHandler,), {'registry': registry})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
@@ -0,0 +1,206 @@
+import collections
+import itertools
+import queue
+import struct
+import threading
+import time
+import pyaudio
+from metrics import REGISTRY
+
+START_DELAY = REGISTRY.timer('playback_start_delay_seconds',
+                             'Time from a clip arriving to its playback starting')
+PLAYBACK_TIME = REGISTRY.timer('playback_seconds', 'Time spent playing one clip',
+                               buckets=(0.5, 1.0, 2.0, 5.0, 10.0, 30.0))
+
+
+def parse_wav_header(data):
+    """Return ((rate, channels, sample_width), data offset) or None if more bytes are needed"""
+    if len(data) < 12:
+        return None
+    if data[:4] != b'RIFF' or data[8:12] != b'WAVE':
+        raise ValueError("Not a WAV stream")
+    params = None
+    offset = 12
+    while len(data) >= offset + 8:
+        chunk_id = data[offset:offset + 4]
+        size, = struct.unpack_from('<I', data, offset + 4)
+        if chunk_id == b'data':
+            if params is None:
+                raise ValueError("WAV data before fmt chunk")
+            return params, offset + 8
+        if len(data) < offset + 8 + size:
+            return None
+        if chunk_id == b'fmt ':
+            _, channels, rate, _, _, bits = struct.unpack_from('<HHIIHH', data, offset + 8)
+            params = (rate, channels, bits // 8)
+        offset += 8 + size + (size & 1)
+    return None
+
+
+class Clip:
+    """A WAV clip that can be played while it is still being received"""
+
+    def __init__(self, clip_id):
+        self.id = clip_id
+        self.state = 'receiving'
+        self.error = None
+        self.params = None
+        self.header = b''
+        self.remainder = b''
+        self.chunks = collections.deque()
+        self.buffered = 0
+        self.received = 0
+        self.played = 0
+        self.complete = False
+        self.created = time.monotonic()
+        self.condition = threading.Condition()
+
+    def feed(self, data):
+        self.received += len(data)
+        if self.params is None:
+            self.header += data
+            parsed = parse_wav_header(self.header)
+            if parsed is None:
+                return
+            self.params, offset = parsed
+            data = self.header[offset:]
+            self.header = b''
+
+        # Only hand whole sample frames to the output stream
+        frame_size = self.params[1] * self.params[2]
+        data = self.remainder + data
+        usable = len(data) - len(data) % frame_size
+        self.remainder = data[usable:]
+        if usable:
+            with self.condition:
+                self.chunks.append(data[:usable])
+                self.buffered += usable
+                self.condition.notify_all()
+
+    def finish(self):
+        with self.condition:
+            self.complete = True
+            self.condition.notify_all()
+
+    def fail(self, error):
+        self.error = error
+        self.state = 'failed'
+        self.finish()
+
+    def status(self):
+        return {
+            'playback_id': self.id,
+            'state': self.state,
+            'error': self.error,
+            'bytes_received': self.received,
+            'bytes_played': self.played,
+        }
+
+
+class StreamPlayer:
+    """Plays clips in order through one long-lived output stream
+
+    Playback of a clip starts once jitter_bytes of audio are buffered (or
+    the clip is complete), so it overlaps with the upload.
+    """
+
+    def __init__(self, jitter_bytes=8192, max_queued=16, history=64):
+        self.jitter_bytes = jitter_bytes
+        self.history = history
+        self.queue = queue.Queue(maxsize=max_queued)
+        self.clips = collections.OrderedDict()
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._playback_loop)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.queue.put(None)
+        if self.thread:
+            self.thread.join()
+
+    def create_clip(self):
+        """Register a new clip and queue it for playback; raises queue.Full when busy"""
+        with self.lock:
+            clip = Clip(next(self.ids))
+            self.queue.put_nowait(clip)
+            self.clips[clip.id] = clip
+            while len(self.clips) > self.history:
+                self.clips.popitem(last=False)
+        return clip
+
+    def status(self, clip_id):
+        with self.lock:
+            clip = self.clips.get(clip_id)
+        return clip.status() if clip else None
+
+    def stats(self):
+        with self.lock:
+            states = [clip.state for clip in self.clips.values()]
+        return {
+            'queued': self.queue.qsize(),
+            # Among the last `history` clips
+            'recent_failed': states.count('failed'),
+        }
+
+    def _play(self, clip, output):
+        with clip.condition:
+            clip.condition.wait_for(
+                lambda: clip.buffered >= self.jitter_bytes or clip.complete)
+        if clip.params is None:
+            if clip.state != 'failed':
+                clip.fail("No audio data")
+            return output
+
+        rate, channels, sample_width = clip.params
+        if output is None or output[0] != clip.params:
+            if output is not None:
+                output[1].stop_stream()
+                output[1].close()
+            stream = self.audio.open(format=self.audio.get_format_from_width(sample_width),
+                                     channels=channels, rate=rate, output=True)
+            output = (clip.params, stream)
+
+        clip.state = 'playing'
+        start = time.monotonic()
+        START_DELAY.observe(start - clip.created)
+        while True:
+            with clip.condition:
+                clip.condition.wait_for(lambda: clip.chunks or clip.complete)
+                if not clip.chunks:
+                    break
+                data = clip.chunks.popleft()
+                clip.buffered -= len(data)
+            output[1].write(data)
+            clip.played += len(data)
+        PLAYBACK_TIME.observe(time.monotonic() - start)
+        if clip.state != 'failed':
+            clip.state = 'done'
+        return output
+
+    def _playback_loop(self):
+        self.audio = pyaudio.PyAudio()
+        # (params, stream); reopened only when a clip's format differs
+        output = None
+        try:
+            while self.running:
+                clip = self.queue.get()
+                if clip is None:
+                    break
+                try:
+                    output = self._play(clip, output)
+                except Exception as e:
+                    print(f"Play audio error: {e}")
+                    clip.fail(str(e))
+        finally:
+            if output is not None:
+                output[1].stop_stream()
+                output[1].close()
+            self.audio.terminate()
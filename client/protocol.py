@@ -0,0 +1,232 @@
+import json
+import struct
+import cv2
+import numpy as np
+
+# Every message is a fixed header followed by a typed payload:
+#   HEADER: magic, protocol version, message type, payload length
+# Frame and audio payloads start with their own typed sub-header, which
+# carries a sequence number and a capture timestamp (time.monotonic() on
+# the client). Replies echo them as
+# {"echo": {"stream": <message type>, "seq": ..., "timestamp": ...}}.
+MAGIC = b'AT'
+PROTOCOL_VERSION = 2
+
+MSG_FRAME = 1
+MSG_AUDIO = 2
+MSG_JSON = 3
+MSG_AUDIO_CHUNK = 4
+MSG_FACES = 5
+
+# Audio chunk flags
+FLAG_END_OF_UTTERANCE = 1
+
+CODEC_RAW = 0
+CODEC_JPEG = 1
+
+HEADER = struct.Struct('!2sBBI')
+# width, height, codec, sequence number, capture timestamp
+FRAME_HEADER = struct.Struct('!HHBId')
+# capture timestamp, sample rate, channels, sample width, user id length
+AUDIO_HEADER = struct.Struct('!dIBBH')
+# utterance id, sequence number, flags, then the AUDIO_HEADER fields
+AUDIO_CHUNK_HEADER = struct.Struct('!IIBdIBBH')
+# frame width, frame height, sequence number, capture timestamp, face count
+FACES_HEADER = struct.Struct('!HHIdB')
+# per face: face id, box x, y, width, height, JPEG length
+FACE_HEADER = struct.Struct('!IHHHHI')
+
+MAX_PAYLOAD = 16 * 1024 * 1024
+
+
+def pack(msg_type, *parts):
+    """Build a complete message from payload parts"""
+    length = sum(len(part) for part in parts)
+    return b''.join((HEADER.pack(MAGIC, PROTOCOL_VERSION, msg_type, length),) + parts)
+
+
+def unpack_header(data):
+    """Return (message type, payload length) from a message header"""
+    magic, version, msg_type, length = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("Bad message magic")
+    if version != PROTOCOL_VERSION:
+        raise ValueError(f"Unsupported protocol version {version}")
+    if length > MAX_PAYLOAD:
+        raise ValueError(f"Message too large: {length} bytes")
+    return msg_type, length
+
+
+def split_message(data):
+    """Return (message type, payload view) for a complete in-memory message"""
+    msg_type, length = unpack_header(data)
+    return msg_type, memoryview(data)[HEADER.size:HEADER.size + length]
+
+
+def encode_frame(frame, quality=80, seq=0, timestamp=0.0):
+    height, width = frame.shape[:2]
+    ok, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise RuntimeError("JPEG encoding failed")
+    header = FRAME_HEADER.pack(width, height, CODEC_JPEG, seq & 0xFFFFFFFF, timestamp)
+    return pack(MSG_FRAME, header, buffer.data)
+
+
+def frame_stamp(payload):
+    """Return (sequence number, capture timestamp) of a frame payload"""
+    return FRAME_HEADER.unpack_from(payload)[3:]
+
+
+def decode_frame(payload):
+    width, height, codec, _, _ = FRAME_HEADER.unpack_from(payload)
+    data = np.frombuffer(payload, dtype=np.uint8, offset=FRAME_HEADER.size)
+    if codec == CODEC_JPEG:
+        return cv2.imdecode(data, cv2.IMREAD_COLOR)
+    return data.reshape(height, width, 3)
+
+
+def encode_faces(frame, faces, quality=80, seq=0, timestamp=0.0):
+    """Encode the face crops of one frame, at the frame's resolution
+
+    faces is a list of (face id, (x, y, w, h)). The payload is FACES_HEADER,
+    then FACE_HEADER for every face, then the JPEG crops in the same order.
+    """
+    height, width = frame.shape[:2]
+    headers = [FACES_HEADER.pack(width, height, seq & 0xFFFFFFFF, timestamp, len(faces))]
+    crops = []
+    for face_id, (x, y, w, h) in faces:
+        ok, buffer = cv2.imencode('.jpg', frame[y:y + h, x:x + w],
+                                  [cv2.IMWRITE_JPEG_QUALITY, quality])
+        if not ok:
+            raise RuntimeError("JPEG encoding failed")
+        headers.append(FACE_HEADER.pack(face_id & 0xFFFFFFFF, x, y, w, h, len(buffer)))
+        crops.append(buffer.data)
+    return pack(MSG_FACES, *headers, *crops)
+
+
+def decode_faces(payload):
+    """Return the frame parameters and, per face, its id, box and JPEG data"""
+    width, height, seq, timestamp, count = FACES_HEADER.unpack_from(payload)
+    offset = FACES_HEADER.size
+    start = offset + count * FACE_HEADER.size
+    faces = []
+    for _ in range(count):
+        face_id, x, y, w, h, length = FACE_HEADER.unpack_from(payload, offset)
+        offset += FACE_HEADER.size
+        faces.append({'id': face_id, 'box': (x, y, w, h), 'data': payload[start:start + length]})
+        start += length
+    return {'width': width, 'height': height, 'seq': seq, 'timestamp': timestamp, 'faces': faces}
+
+
+def decode_face_image(data):
+    return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+
+def encode_audio(pcm, rate, channels, sample_width, user_id=None, timestamp=0.0):
+    user = b'' if user_id is None else str(user_id).encode('utf-8')
+    header = AUDIO_HEADER.pack(timestamp, rate, channels, sample_width, len(user))
+    return pack(MSG_AUDIO, header, user, pcm)
+
+
+def decode_audio(payload):
+    """Return the audio parameters and a view of the PCM data"""
+    timestamp, rate, channels, sample_width, user_length = AUDIO_HEADER.unpack_from(payload)
+    start = AUDIO_HEADER.size
+    user = payload[start:start + user_length]
+    return {
+        'timestamp': timestamp,
+        'rate': rate,
+        'channels': channels,
+        'sample_width': sample_width,
+        'user_id': str(user, 'utf-8') if user_length else None,
+        'data': payload[start + user_length:],
+    }
+
+
+def encode_audio_chunk(utterance_id, seq, pcm, rate, channels, sample_width,
+                       user_id=None, end=False, timestamp=0.0):
+    """Encode one chunk of a streamed utterance"""
+    user = b'' if user_id is None else str(user_id).encode('utf-8')
+    flags = FLAG_END_OF_UTTERANCE if end else 0
+    header = AUDIO_CHUNK_HEADER.pack(utterance_id & 0xFFFFFFFF, seq, flags, timestamp,
+                                     rate, channels, sample_width, len(user))
+    return pack(MSG_AUDIO_CHUNK, header, user, pcm)
+
+
+def decode_audio_chunk(payload):
+    (utterance_id, seq, flags, timestamp, rate, channels,
+     sample_width, user_length) = AUDIO_CHUNK_HEADER.unpack_from(payload)
+    start = AUDIO_CHUNK_HEADER.size
+    user = payload[start:start + user_length]
+    return {
+        'utterance_id': utterance_id,
+        'seq': seq,
+        'end': bool(flags & FLAG_END_OF_UTTERANCE),
+        'timestamp': timestamp,
+        'rate': rate,
+        'channels': channels,
+        'sample_width': sample_width,
+        'user_id': str(user, 'utf-8') if user_length else None,
+        'data': payload[start + user_length:],
+    }
+
+
+def encode_json(obj):
+    return pack(MSG_JSON, json.dumps(obj).encode('utf-8'))
+
+
+def decode_json(payload):
+    return json.loads(str(payload, 'utf-8'))
+
+
+class MessageReader:
+    """Incrementally parse framed messages from a socket
+
+    Bytes are received with recv_into into a growable buffer, so a header
+    or payload split across reads is simply completed by the next read.
+    """
+
+    def __init__(self, sock, size=64 * 1024):
+        self.sock = sock
+        self.buffer = bytearray(size)
+        self.end = 0
+
+    def _grow(self, size):
+        buffer = bytearray(max(size, 2 * len(self.buffer)))
+        buffer[:self.end] = self.buffer[:self.end]
+        self.buffer = buffer
+
+    def pump(self, handler):
+        """Read what is available and call handler(msg_type, payload) per message
+
+        The payload is a memoryview into the receive buffer and is only
+        valid during the handler call.
+        """
+        if self.end == len(self.buffer):
+            self._grow(2 * len(self.buffer))
+        with memoryview(self.buffer) as view:
+            received = self.sock.recv_into(view[self.end:])
+        if not received:
+            raise ConnectionError("Connection closed by server")
+        self.end += received
+
+        start = 0
+        needed = 0
+        with memoryview(self.buffer) as view:
+            while self.end - start >= HEADER.size:
+                msg_type, length = unpack_header(view[start:start + HEADER.size])
+                total = HEADER.size + length
+                if self.end - start < total:
+                    needed = total
+                    break
+                with view[start + HEADER.size:start + total] as payload:
+                    handler(msg_type, payload)
+                start += total
+
+        # Move any partial message to the front of the buffer
+        if start:
+            remaining = self.end - start
+            self.buffer[:remaining] = self.buffer[start:self.end]
+            self.end = remaining
+        if needed > len(self.buffer):
+            self._grow(needed)
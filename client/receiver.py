@@ -0,0 +1,52 @@
+import selectors
+import socket
+import threading
+import protocol
+
+
+class ResponseReceiver:
+    """Reads server messages on their own thread as soon as they arrive"""
+
+    def __init__(self, sock, on_message):
+        self.sock = sock
+        self.on_message = on_message
+        self.reader = protocol.MessageReader(sock)
+        self.running = False
+        self.thread = None
+        # Written to by stop() to wake the selector
+        self.wake_read, self.wake_write = socket.socketpair()
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._receive_loop)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.wake_write.send(b'\0')
+        if self.thread:
+            self.thread.join()
+
+    def _dispatch(self, msg_type, payload):
+        if msg_type == protocol.MSG_JSON:
+            self.on_message(protocol.decode_json(payload))
+        else:
+            print(f"Ignoring unexpected message type {msg_type}")
+
+    def _receive_loop(self):
+        selector = selectors.DefaultSelector()
+        selector.register(self.sock, selectors.EVENT_READ)
+        selector.register(self.wake_read, selectors.EVENT_READ)
+
+        try:
+            while self.running:
+                for key, _ in selector.select():
+                    if key.fileobj is self.wake_read:
+                        return
+                    self.reader.pump(self._dispatch)
+        except Exception as e:
+            print(f"Error receiving data: {e}")
+        finally:
+            selector.close()
+            self.running = False
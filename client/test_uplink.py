@@ -0,0 +1,61 @@
+import unittest
+import numpy as np
+from change_gate import ChangeGate
+from face_tracker import FaceTracker
+from uplink import FrameSender
+
+
+class FixedDetector:
+    """Finds the same boxes in every frame"""
+
+    def __init__(self, boxes):
+        self.boxes = boxes
+
+    def detect(self, frame):
+        return list(self.boxes)
+
+
+class FaceUploadTest(unittest.TestCase):
+    def setUp(self):
+        self.messages = []
+        self.gate = ChangeGate(cooldown=1.0, keepalive=30.0)
+        self.tracker = FaceTracker(retry=1.0, max_retry=4.0)
+        self.detector = FixedDetector([(40, 40, 60, 60)])
+        self.sender = FrameSender(None, self.messages.append, self.gate,
+                                  face_detector=self.detector, face_tracker=self.tracker)
+        # A still scene, so the gate never sees a change
+        self.frame = np.zeros((240, 320, 3), dtype=np.uint8)
+
+    def run_checks(self, start, end, interval=0.25):
+        """Check the frame every interval seconds; returns the times it was sent"""
+        sent = []
+        for step in range(round((end - start) / interval)):
+            now = start + step * interval
+            if self.sender.check(self.frame, now, now=now):
+                sent.append(now)
+        return sent
+
+    def test_unresolved_track_is_retried_while_gate_suppresses(self):
+        # Uploaded at once, then retried after 1, 2 and 4 s (capped)
+        self.assertEqual(self.run_checks(0.0, 12.0), [0.0, 1.0, 3.0, 7.0, 11.0])
+        self.assertGreater(self.gate.stats()['suppressed'], 0)
+        # The gate only counts frames that were actually uploaded
+        self.assertEqual(self.gate.stats()['sent'], len(self.messages))
+
+    def test_resolved_track_is_not_sent_and_leaves_gate_alone(self):
+        self.assertEqual(self.run_checks(0.0, 0.25), [0.0])
+        self.tracker.resolve(self.sender.seq, now=0.1)
+        last_sent_time = self.gate.last_sent_time
+        self.assertEqual(self.run_checks(0.25, 12.0), [])
+        self.assertEqual(self.gate.last_sent_time, last_sent_time)
+        self.assertEqual(self.gate.stats()['sent'], 1)
+
+    def test_frames_without_faces_leave_gate_alone(self):
+        self.detector.boxes = []
+        self.assertEqual(self.run_checks(0.0, 2.0), [])
+        self.assertEqual(self.gate.stats(), {'sent': 0, 'suppressed': 0})
+        self.assertIsNone(self.gate.reference)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import collections
+import io
+import subprocess
+import threading
+import pygame
+
+
+class SpeechCache:
+    """Bounded LRU cache of synthesized speech kept in memory as pygame Sounds"""
+
+    def __init__(self, max_entries=32, voice='en', speed=175):
+        self.max_entries = max_entries
+        self.voice = voice
+        self.speed = speed
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def synthesize(self, text):
+        """Run espeak and load its WAV output without touching the filesystem"""
+        # The text comes from the server, so it goes in on stdin where it
+        # can never be taken for an option (e.g. a reply starting with -w)
+        result = subprocess.run(
+            ['espeak', '-v', self.voice, '-s', str(self.speed), '--stdout', '--stdin'],
+            input=text.encode('utf-8'), capture_output=True, check=True)
+        return pygame.mixer.Sound(file=io.BytesIO(result.stdout))
+
+    def get(self, text):
+        key = (text, self.voice, self.speed)
+        with self.lock:
+            sound = self.entries.get(key)
+            if sound is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return sound
+            self.misses += 1
+
+        sound = self.synthesize(text)
+        with self.lock:
+            self.entries[key] = sound
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return sound
+
+    def prewarm(self, phrases):
+        """Synthesize frequent phrases in the background"""
+        def run():
+            for phrase in phrases:
+                try:
+                    self.get(phrase)
+                except Exception as e:
+                    print(f"Error pre-synthesizing '{phrase}': {e}")
+
+        thread = threading.Thread(target=run)
+        thread.daemon = True
+        thread.start()
+
+    def stats(self):
+        with self.lock:
+            return {'entries': len(self.entries), 'hits': self.hits, 'misses': self.misses}
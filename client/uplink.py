@@ -0,0 +1,185 @@
+import threading
+import time
+import cv2
+import protocol
+from change_gate import ChangeGate
+from vad import EnergyVAD
+from metrics import REGISTRY
+
+ENCODE_TIME = REGISTRY.timer('frame_encode_seconds', 'Time to resize and encode one frame')
+DETECT_TIME = REGISTRY.timer('face_detect_seconds', 'Time to find the faces in one frame')
+
+
+class FrameSender:
+    """Uploads the frames of a FrameConsumer with send(message)
+
+    The newest frame is checked every check_interval seconds. Whole frames
+    are downscaled to size and sent when the change gate lets them through.
+    With a face_detector, faces are detected and tracked on every checked
+    frame, so a person standing still keeps their track while the gate holds
+    uploads back, and only crops of tracks the server has not resolved are
+    sent, at the frame's own resolution. A new track, or one whose retry is
+    due, is sent even when the gate would hold the frame back.
+    """
+
+    def __init__(self, consumer, send, gate=None, check_interval=0.2, jpeg_quality=80,
+                 size=(320, 240), face_detector=None, face_tracker=None, face_quality=90):
+        self.consumer = consumer
+        self.send = send
+        self.gate = gate if gate is not None else ChangeGate()
+        self.check_interval = check_interval
+        self.jpeg_quality = jpeg_quality
+        self.size = size
+        self.face_detector = face_detector
+        self.face_tracker = face_tracker
+        self.face_quality = face_quality
+        # Numbers the frames actually uploaded, so gaps in the echoes are losses
+        self.seq = 0
+        self.checked = 0
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._send_loop)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+
+    def stats(self):
+        return {'checked': self.checked, 'sent': self.seq}
+
+    def check(self, frame, timestamp, now=None):
+        """Upload frame if it should be; returns True when it was sent"""
+        if now is None:
+            now = time.monotonic()
+        self.checked += 1
+        faces = None
+        if self.face_detector is not None:
+            with DETECT_TIME.time():
+                boxes = self.face_detector.detect(frame)
+            tracked = self.face_tracker.update(boxes, now)
+            # Tracks the server already recognized are not sent again
+            faces = self.face_tracker.select(tracked, now)
+            if not faces:
+                return False
+        # Only upload when the scene has changed, unless a track is new or
+        # still waiting for the server to recognize it
+        due = faces is not None and self.face_tracker.due(faces, now)
+        if not due and not self.gate.should_send(frame, now):
+            return False
+
+        with ENCODE_TIME.time():
+            if faces is not None:
+                message = protocol.encode_faces(frame, faces, self.face_quality,
+                                                self.seq + 1, timestamp)
+            else:
+                # Resize frame for network efficiency
+                small_frame = cv2.resize(frame, self.size)
+                message = protocol.encode_frame(small_frame, self.jpeg_quality,
+                                                self.seq + 1, timestamp)
+        self.send(message)
+        self.seq += 1
+        # Only frames that left count as sent for the gate and the tracker
+        self.gate.commit(frame, now)
+        if faces is not None:
+            self.face_tracker.sent(self.seq, faces, now)
+        return True
+
+    def _send_loop(self):
+        last_check = 0.0
+        while self.running:
+            try:
+                delay = last_check + self.check_interval - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+
+                frame = self.consumer.wait_next(timeout=1)
+                last_check = time.monotonic()
+                if frame is not None:
+                    self.check(frame, self.consumer.timestamp)
+            except Exception as e:
+                print(f"Error in send_frames: {e}")
+                time.sleep(1)  # Wait before retrying
+
+
+class VoiceRecorder:
+    """Sends voice commands read from a PyAudio-style input stream
+
+    record() reads one chunk after another until is_recording() turns
+    false. With a vad_threshold, silence around the speech is trimmed by
+    an EnergyVAD. Chunks are streamed as MSG_AUDIO_CHUNK while the user is
+    still speaking, or with stream=False sent as one MSG_AUDIO at the end.
+    """
+
+    def __init__(self, send, rate=44100, channels=1, sample_width=2, chunk=1024,
+                 stream=True, vad_threshold=500):
+        self.send = send
+        self.rate = rate
+        self.channels = channels
+        self.sample_width = sample_width
+        self.chunk = chunk
+        self.stream = stream
+        self.vad_threshold = vad_threshold
+        self.utterances = 0
+        self.chunks_sent = 0
+
+    def stats(self):
+        return {'utterances': self.utterances, 'chunks_sent': self.chunks_sent}
+
+    def record(self, microphone, utterance_id, is_recording, user_id=None):
+        """Record and send one utterance; microphone needs read(frames, exception_on_overflow)"""
+        vad = EnergyVAD(self.vad_threshold) if self.vad_threshold else None
+        frames = []
+        seq = 0
+        chunk_duration = self.chunk / self.rate
+        # Capture time of the first sample after the last emitted chunk
+        next_start = 0.0
+        first_start = None
+
+        def emit(chunks, start):
+            # Emitted chunks are consecutive and begin at start
+            nonlocal seq, next_start, first_start
+            for chunk in chunks:
+                if first_start is None:
+                    first_start = start
+                if self.stream:
+                    # Upload while the user is still speaking
+                    self.send(protocol.encode_audio_chunk(
+                        utterance_id, seq, chunk, self.rate, self.channels,
+                        self.sample_width, user_id, timestamp=start))
+                    seq += 1
+                    self.chunks_sent += 1
+                else:
+                    frames.append(chunk)
+                start += chunk_duration
+            next_start = start
+
+        while is_recording():
+            data = microphone.read(self.chunk, exception_on_overflow=False)
+            chunks = vad.process(data) if vad else [data]
+            # The chunks returned end with the one just read
+            emit(chunks, time.monotonic() - len(chunks) * chunk_duration)
+
+        if vad:
+            emit(vad.finish(), next_start)
+
+        if self.stream:
+            if seq:
+                self.send(protocol.encode_audio_chunk(
+                    utterance_id, seq, b'', self.rate, self.channels,
+                    self.sample_width, user_id, end=True, timestamp=next_start))
+                self.utterances += 1
+            else:
+                print("No speech detected")
+        elif frames:
+            # Send the whole utterance to server
+            self.send(protocol.encode_audio(
+                b''.join(frames), self.rate, self.channels, self.sample_width, user_id,
+                timestamp=first_start))
+            self.utterances += 1
@@ -0,0 +1,104 @@
+import io
+import queue
+import threading
+import time
+import requests
+from metrics import REGISTRY
+
+UPLOAD_TIME = REGISTRY.timer('upload_seconds', 'Time to post one frame to the server')
+BYTES_SENT = REGISTRY.counter('upload_sent_bytes', 'Frame bytes posted to the server')
+
+
+class _TimedBody(io.BytesIO):
+    """Request body that notes when the last of it was handed to the socket"""
+
+    def __init__(self, data):
+        super().__init__(data)
+        self.done = None
+
+    def read(self, size=-1):
+        data = super().read(size)
+        if not data and self.done is None:
+            self.done = time.monotonic()
+        return data
+
+
+class FrameUploader:
+    """Posts frames to the server from a background thread
+
+    Frames wait in a small bounded queue that discards the oldest frame
+    when full, and are sent over a pooled keep-alive session. The
+    controller sees only the time to upload each frame, not the server's
+    recognition time that the response also waits for.
+    """
+
+    def __init__(self, url, pi_id, controller=None, queue_size=2, timeout=2.0):
+        self.url = url
+        self.pi_id = pi_id
+        self.controller = controller
+        self.timeout = timeout
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.session = requests.Session()
+        self.running = False
+        self.thread = None
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._upload_loop)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread:
+            self.thread.join()
+        self.session.close()
+
+    def submit(self, frame_bytes):
+        """Queue a frame without blocking, replacing the oldest if full"""
+        while True:
+            try:
+                self.queue.put_nowait(frame_bytes)
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def _upload_loop(self):
+        while self.running:
+            try:
+                frame_bytes = self.queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+
+            request = self.session.prepare_request(requests.Request(
+                'POST', self.url, files={"frame": frame_bytes}, data={"pi_id": self.pi_id}))
+            # Content-Length is already set, so the body is still sent in one piece
+            body = request.body = _TimedBody(request.body)
+            start = time.monotonic()
+            try:
+                response = self.session.send(request, timeout=self.timeout)
+                response.close()
+                self.sent += 1
+                BYTES_SENT.inc(len(frame_bytes))
+            except requests.exceptions.RequestException:
+                self.failed += 1  # Continue even if the server is temporarily unavailable
+            end = time.monotonic()
+            UPLOAD_TIME.observe(end - start)
+            if self.controller:
+                # Upload time only; a failure before the body went out counts in full
+                self.controller.observe_latency((body.done or end) - start)
+
+    def stats(self):
+        return {
+            'sent': self.sent,
+            'failed': self.failed,
+            'dropped': self.dropped,
+            'queued': self.queue.qsize(),
+        }
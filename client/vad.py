@@ -0,0 +1,57 @@
+import collections
+import numpy as np
+
+
+class EnergyVAD:
+    """Energy-based voice activity detector that trims leading and trailing silence
+
+    Chunks are fed in as they are recorded; process() returns the chunks
+    that can be sent right away. Silence before the first voiced chunk is
+    dropped except for a short pre-roll, and silence after the last voiced
+    chunk is held back and dropped by finish(), except for a short tail.
+    """
+
+    def __init__(self, threshold=500, pre_roll=3, tail=3):
+        self.threshold = threshold
+        self.tail = tail
+        self.leading = collections.deque(maxlen=pre_roll)
+        self.trailing = []
+        self.speech_started = False
+        self.trimmed = 0
+
+    def is_voiced(self, chunk):
+        samples = np.frombuffer(chunk, dtype=np.int16).astype(np.float32)
+        if not len(samples):
+            return False
+        rms = np.sqrt(np.dot(samples, samples) / len(samples))
+        return rms >= self.threshold
+
+    def process(self, chunk):
+        if self.is_voiced(chunk):
+            if self.speech_started:
+                chunks = self.trailing + [chunk]
+            else:
+                chunks = list(self.leading) + [chunk]
+                self.leading.clear()
+                self.speech_started = True
+            self.trailing = []
+            return chunks
+
+        if self.speech_started:
+            self.trailing.append(chunk)
+        else:
+            if len(self.leading) == self.leading.maxlen:
+                self.trimmed += 1
+            self.leading.append(chunk)
+        return []
+
+    def finish(self):
+        """Return the tail to send and drop the rest of the trailing silence"""
+        if not self.speech_started:
+            self.trimmed += len(self.leading)
+            self.leading.clear()
+            return []
+        chunks = self.trailing[:self.tail]
+        self.trimmed += len(self.trailing) - len(chunks)
+        self.trailing = []
+        return chunks
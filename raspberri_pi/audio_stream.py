@@ -1,28 +1,36 @@
-import numpy as np
-import pyaudio
+from audio_ring import AudioCapture
+
+class CaptureStopped(RuntimeError):
+    """The capture was stopped for good; reading again cannot succeed"""
 
 class AudioStream:
-    def __init__(self, format=pyaudio.paInt16, channels=1, rate=16000, chunk=1024):
-        self.format = format
+    def __init__(self, channels=1, rate=16000, chunk=1024, microphone=None):
         self.channels = channels
         self.rate = rate
         self.chunk = chunk
+        # Capture time of the first sample of the last chunk returned
+        self.timestamp = None
         
-        self.p = pyaudio.PyAudio()
-        self.stream = self.p.open(
-            format=self.format,
-            channels=self.channels,
-            rate=self.rate,
-            input=True,
-            frames_per_buffer=self.chunk
-        )
+        # PyAudio in callback mode fills a ring buffer; microphone can stand
+        # in for PyAudio, see audio_ring.AudioCapture
+        self.capture = AudioCapture(self.rate, self.channels, self.chunk, microphone=microphone)
+        self.capture.start()
         
     def get_audio(self):
-        """Get audio chunk from microphone"""
-        data = self.stream.read(self.chunk)
-        return np.frombuffer(data, dtype=np.int16)
+        """Get audio chunk from microphone
+        
+        Returns a view into the ring buffer, valid for its 4 s of audio
+        """
+        item = self.capture.read(self.chunk)
+        while item is None and self.capture.running:
+            item = self.capture.read(self.chunk)
+        if item is None:
+            raise CaptureStopped("Audio capture stopped")
+        self.timestamp, samples = item
+        return samples
+    
+    def stats(self):
+        return self.capture.stats()
         
     def __del__(self):
-        self.stream.stop_stream()
-        self.stream.close()
-        self.p.terminate()
\ No newline at end of file
+        self.capture.stop()
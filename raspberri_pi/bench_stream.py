@@ -0,0 +1,123 @@
+# bench_stream.py - The WebSocket client against a loopback server, no Pi hardware needed
+import asyncio
+import json
+import threading
+import time
+import websockets
+import protocol
+from latency import Histogram
+from main import RaspberryPiClient
+from fake_devices import SyntheticCamera, SyntheticMicrophone, NullOutput
+from bench_harness import WARMUP, result, main
+
+STREAM_NAMES = {protocol.STREAM_CAMERA: 'camera', protocol.STREAM_AUDIO: 'audio'}
+
+
+class LoopbackServer:
+    """Stands in for the PC server
+
+    Accepts the client's binary media messages, measures capture-to-receive
+    latency from their headers and echoes seq and timestamp back in a JSON
+    ack, as the server does.
+    """
+
+    def __init__(self):
+        self.port = None
+        self.ready = threading.Event()
+        self.loop = None
+        self.done = None
+        self.thread = None
+        self.messages = dict.fromkeys(STREAM_NAMES, 0)
+        self.bytes = dict.fromkeys(STREAM_NAMES, 0)
+        self.latency = {stream: Histogram() for stream in STREAM_NAMES}
+        self.cpu = 0.0
+
+    def start(self):
+        self.thread = threading.Thread(target=lambda: asyncio.run(self._serve()))
+        self.thread.daemon = True
+        self.thread.start()
+        self.ready.wait()
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.done.set_result, None)
+        self.thread.join()
+
+    def reset_latency(self):
+        self.latency = {stream: Histogram() for stream in STREAM_NAMES}
+
+    async def _serve(self):
+        self.start_cpu = time.thread_time()
+        self.loop = asyncio.get_running_loop()
+        self.done = self.loop.create_future()
+        async with websockets.serve(self._handle, '127.0.0.1', 0) as server:
+            self.port = server.sockets[0].getsockname()[1]
+            self.ready.set()
+            await self.done
+
+    async def _handle(self, websocket):
+        try:
+            async for message in websocket:
+                if not isinstance(message, bytes):
+                    continue
+                header = protocol.decode_header(message)
+                self.latency[header.stream].record((time.monotonic() - header.timestamp) * 1e6)
+                self.messages[header.stream] += 1
+                self.bytes[header.stream] += len(message)
+                await websocket.send(json.dumps({
+                    'echo': {'stream': header.stream, 'seq': header.seq,
+                             'timestamp': header.timestamp},
+                }))
+                self.cpu = time.thread_time() - self.start_cpu
+        except websockets.ConnectionClosed:
+            pass
+
+
+def bench_websocket(seconds, audio_codec=protocol.CODEC_ADPCM):
+    """Both streams of one client; the CPU columns are for the whole client"""
+    server = LoopbackServer()
+    server.start()
+    client = RaspberryPiClient(f"ws://127.0.0.1:{server.port}", audio_codec,
+                               camera=SyntheticCamera(), audio=SyntheticMicrophone(),
+                               output=NullOutput())
+
+    def run_client():
+        try:
+            client.start()
+        except (websockets.ConnectionClosed, OSError):
+            pass
+
+    thread = threading.Thread(target=run_client)
+    thread.daemon = True
+    thread.start()
+    time.sleep(WARMUP)
+
+    messages, size, server_cpu = dict(server.messages), dict(server.bytes), server.cpu
+    server.reset_latency()
+    start, start_cpu = time.monotonic(), time.process_time()
+    time.sleep(seconds)
+    elapsed = time.monotonic() - start
+    cpu = time.process_time() - start_cpu - (server.cpu - server_cpu)
+    total = sum(server.messages.values()) - sum(messages.values())
+
+    client.running = False
+    server.stop()
+    thread.join()
+
+    results = []
+    for stream, name in STREAM_NAMES.items():
+        row = result(f'websocket-{name}', server.messages[stream] - messages[stream],
+                     server.bytes[stream] - size[stream], cpu, elapsed, server.latency[stream])
+        # The CPU time is the whole client's, spread over both streams
+        row['cpu_ms_per_frame'] = 1000 * cpu / total if total else 0.0
+        results.append(row)
+    return results
+
+
+VARIANTS = {
+    'websocket': bench_websocket,
+    'websocket-raw-audio': lambda seconds: bench_websocket(seconds, protocol.CODEC_RAW),
+}
+
+
+if __name__ == "__main__":
+    main("Benchmark the client against a loopback server", VARIANTS)
@@ -1,5 +1,10 @@
 import numpy as np
-from picamera2 import Picamera2
+
+try:
+    from picamera2 import Picamera2
+except ImportError:
+    # Only needed on the Pi, see fake_devices.SyntheticCamera
+    Picamera2 = None
 
 class CameraStream:
     def __init__(self, width=640, height=480):
@@ -0,0 +1,151 @@
+# Identical copies live in client/, raspberry_pi/ and raspberri_pi/, which are
+# each deployed on their own; change them together.
+import threading
+import time
+
+
+class Histogram:
+    """Log-linear histogram of non-negative integers, in the style of HdrHistogram
+
+    Every power-of-two range is split into 2 ** precision_bits equal buckets,
+    so a reported value is within 1 / 2 ** precision_bits of the recorded one
+    whatever its magnitude. Buckets are kept in a dict, so only ranges that
+    were actually hit take memory.
+    """
+
+    def __init__(self, precision_bits=5):
+        self.precision_bits = precision_bits
+        self.counts = {}
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def _bucket(self, value):
+        shift = max(0, value.bit_length() - self.precision_bits - 1)
+        return (value >> shift) << shift, (1 << shift) - 1
+
+    def record(self, value, count=1):
+        value = max(0, int(value))
+        bucket, _ = self._bucket(value)
+        self.counts[bucket] = self.counts.get(bucket, 0) + count
+        self.count += count
+        self.total += value * count
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def reset(self):
+        self.counts.clear()
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, percent):
+        """Highest value equivalent to the given percentile, 0 if empty"""
+        if not self.count:
+            return 0
+        target = max(1, percent / 100 * self.count)
+        seen = 0
+        for bucket in sorted(self.counts):
+            seen += self.counts[bucket]
+            if seen >= target:
+                _, width = self._bucket(bucket)
+                return min(bucket + width, self.max)
+        return self.max
+
+    def distribution(self, percents=(50, 90, 99, 99.9, 100)):
+        return {percent: self.percentile(percent) for percent in percents}
+
+
+class StreamMonitor:
+    """End-to-end latency and loss of one media stream
+
+    Fed with the (sequence number, capture timestamp) pairs the server
+    echoes back. Latency is measured against time.monotonic(), so the
+    timestamps must come from the same host's monotonic clock. A gap in the
+    echoed sequence numbers counts as lost messages until a late one
+    arrives, which is then counted as reordered instead.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.lock = threading.Lock()
+        # Latency in microseconds, and the length of each run of lost messages
+        self.latency = Histogram()
+        self.gaps = Histogram()
+        self.received = 0
+        self.lost = 0
+        self.reordered = 0
+        self.duplicates = 0
+        self.highest = None
+
+    def record(self, seq, timestamp, now=None):
+        """Record one echo; seq may be None for latency-only streams.
+        Returns the latency in seconds."""
+        if now is None:
+            now = time.monotonic()
+        latency = now - timestamp
+        with self.lock:
+            self.received += 1
+            self.latency.record(latency * 1e6)
+            if seq is None:
+                pass
+            elif self.highest is None or seq > self.highest:
+                if self.highest is not None and seq > self.highest + 1:
+                    self.lost += seq - self.highest - 1
+                    self.gaps.record(seq - self.highest - 1)
+                self.highest = seq
+            elif seq == self.highest:
+                self.duplicates += 1
+            else:
+                self.reordered += 1
+                self.lost = max(0, self.lost - 1)
+        return latency
+
+    def reset(self):
+        with self.lock:
+            self.latency.reset()
+            self.gaps.reset()
+            self.received = self.lost = self.reordered = self.duplicates = 0
+            self.highest = None
+
+    def stats(self):
+        with self.lock:
+            expected = self.received + self.lost
+            return {
+                'received': self.received,
+                'lost': self.lost,
+                'loss': self.lost / expected if expected else 0.0,
+                'reordered': self.reordered,
+                'duplicates': self.duplicates,
+                'latency_ms': {percent: value / 1000 for percent, value
+                               in self.latency.distribution().items()},
+                'latency_avg_ms': self.latency.mean / 1000,
+                'gap_max': self.gaps.max or 0,
+            }
+
+    def dump(self):
+        """Readable summary with the full latency percentile distribution"""
+        with self.lock:
+            lines = [f"{self.name}: {self.received} received, {self.lost} lost, "
+                     f"{self.reordered} reordered, {self.duplicates} duplicates"]
+            if self.latency.count:
+                lines.append(f"  latency ms  min {self.latency.min / 1000:.1f}  "
+                             f"avg {self.latency.mean / 1000:.1f}")
+                for percent in (50, 75, 90, 95, 99, 99.9, 100):
+                    lines.append(f"  p{percent:<5} {self.latency.percentile(percent) / 1000:9.1f}")
+            if self.gaps.count:
+                lines.append(f"  loss bursts {self.gaps.count}: "
+                             f"p50 {self.gaps.percentile(50)}  max {self.gaps.max}")
+        return '\n'.join(lines)
+
+
+def dump_all(monitors):
+    for monitor in monitors:
+        if monitor is not None:
+            print(monitor.dump())
@@ -1,57 +1,169 @@
 import asyncio
 import websockets
 import json
+import signal
 import threading
+import time
+import protocol
+from latency import StreamMonitor, dump_all
 from camera_stream import CameraStream
-from audio_stream import AudioStream
+from audio_stream import AudioStream, CaptureStopped
 from output_manager import OutputManager
 
+# Microphone codec carried in each audio message header
+AUDIO_CODEC = protocol.CODEC_ADPCM
+CAMERA_FPS = 10
+# Captured items waiting to be sent; when a queue is full the oldest item
+# is dropped, so a slow connection costs frames instead of latency
+CAMERA_QUEUE_SIZE = 2
+# About 1 s of 1024-sample chunks at 16 kHz; audio chunks are views into
+# the capture ring, which holds 4 s, so they must not wait longer than that
+AUDIO_QUEUE_SIZE = 16
+
 class RaspberryPiClient:
-    def __init__(self, server_uri="ws://192.168.83.133:8765"):  # Replace with your PC's IP
+    def __init__(self, server_uri="ws://192.168.83.133:8765",  # Replace with your PC's IP
+                 audio_codec=AUDIO_CODEC, camera=None, audio=None, output=None):
         self.server_uri = server_uri
-        self.camera = CameraStream()
-        self.audio = AudioStream()
-        self.output = OutputManager()
+        self.audio_codec = audio_codec
+        # Devices can be replaced, e.g. with the fake_devices ones off the Pi
+        self.camera = camera if camera is not None else CameraStream()
+        self.audio = audio if audio is not None else AudioStream()
+        self.output = output if output is not None else OutputManager()
         self.running = False
+        # Latency and loss per stream, from the stamps echoed by the server
+        self.monitors = {
+            protocol.STREAM_CAMERA: StreamMonitor('camera'),
+            protocol.STREAM_AUDIO: StreamMonitor('audio'),
+        }
+        # Captured items dropped because their queue was full
+        self.dropped = {protocol.STREAM_CAMERA: 0, protocol.STREAM_AUDIO: 0}
+        self.next_frame = 0.0
+        
+    def dump_latency(self):
+        dump_all(self.monitors.values())
+        print(f"dropped: camera {self.dropped[protocol.STREAM_CAMERA]}, "
+              f"audio {self.dropped[protocol.STREAM_AUDIO]}")
         
     async def connect(self):
         async with websockets.connect(self.server_uri) as websocket:
             self.running = True
+            loop = asyncio.get_running_loop()
             
-            # Start camera and audio streams
-            camera_task = asyncio.create_task(self.stream_camera(websocket))
-            audio_task = asyncio.create_task(self.stream_audio(websocket))
-            receive_task = asyncio.create_task(self.receive_commands(websocket))
+            # The devices block, so each is read on its own thread and the
+            # event loop only ever waits on the queues
+            camera_queue = asyncio.Queue(CAMERA_QUEUE_SIZE)
+            audio_queue = asyncio.Queue(AUDIO_QUEUE_SIZE)
+            self.next_frame = 0.0
+            captures = [
+                threading.Thread(target=self.capture_loop, daemon=True,
+                                 args=(loop, camera_queue, protocol.STREAM_CAMERA, self.capture_frame)),
+                threading.Thread(target=self.capture_loop, daemon=True,
+                                 args=(loop, audio_queue, protocol.STREAM_AUDIO, self.capture_audio)),
+            ]
+            for thread in captures:
+                thread.start()
             
-            await asyncio.gather(camera_task, audio_task, receive_task)
+            try:
+                # Start camera and audio streams
+                camera_task = asyncio.create_task(self.stream_camera(websocket, camera_queue))
+                audio_task = asyncio.create_task(self.stream_audio(websocket, audio_queue))
+                receive_task = asyncio.create_task(self.receive_commands(websocket))
+                
+                await asyncio.gather(camera_task, audio_task, receive_task)
+            finally:
+                self.running = False
+    
+    def capture_frame(self):
+        """Read one frame, holding CAMERA_FPS; returns (frame, capture time)"""
+        if self.next_frame:
+            delay = self.next_frame - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        frame = self.camera.get_frame()
+        timestamp = time.monotonic()
+        self.next_frame = max(self.next_frame + 1.0 / CAMERA_FPS, timestamp)
+        return frame, timestamp
     
-    async def stream_camera(self, websocket):
+    def capture_audio(self):
+        """Read one chunk; returns (samples, capture time of its first sample)"""
+        audio_data = self.audio.get_audio()
+        # Stamped from the ring buffer's sample clock
+        return audio_data, self.audio.timestamp
+    
+    def capture_loop(self, loop, queue, stream, capture):
+        """Runs on a capture thread, handing each item to the event loop"""
         while self.running:
-            frame = self.camera.get_frame()
-            await websocket.send(json.dumps({
-                'type': 'camera',
-                'data': frame.tolist()  # Convert numpy array to list
-            }))
-            await asyncio.sleep(0.1)  # 10 FPS
-    
-    async def stream_audio(self, websocket):
+            try:
+                item = capture()
+            except CaptureStopped as e:
+                # Retrying cannot bring the device back
+                print(f"Capture ended on stream {stream}: {e}")
+                break
+            except Exception as e:
+                print(f"Capture error on stream {stream}: {e}")
+                time.sleep(1)
+                continue
+            try:
+                loop.call_soon_threadsafe(self.enqueue, queue, stream, item)
+            except RuntimeError:
+                # The event loop has closed
+                break
+    
+    def enqueue(self, queue, stream, item):
+        if queue.full():
+            queue.get_nowait()
+            self.dropped[stream] += 1
+        queue.put_nowait(item)
+    
+    async def next_item(self, queue):
+        """Wait for the next captured item; None once the client stops"""
         while self.running:
-            audio_data = self.audio.get_audio()
-            await websocket.send(json.dumps({
-                'type': 'audio',
-                'data': audio_data.tolist()
-            }))
-            await asyncio.sleep(0.05)  # 20Hz update rate
+            try:
+                return await asyncio.wait_for(queue.get(), timeout=1)
+            except asyncio.TimeoutError:
+                continue
+        return None
+    
+    async def stream_camera(self, websocket, queue):
+        seq = 0
+        while True:
+            item = await self.next_item(queue)
+            if item is None:
+                break
+            frame, timestamp = item
+            # Binary frame: typed header followed by the JPEG payload
+            await websocket.send(protocol.encode_camera(frame, seq, timestamp))
+            seq += 1
+    
+    async def stream_audio(self, websocket, queue):
+        seq = 0
+        while True:
+            item = await self.next_item(queue)
+            if item is None:
+                break
+            audio_data, timestamp = item
+            await websocket.send(protocol.encode_audio(audio_data, seq, timestamp,
+                                                       self.audio_codec))
+            seq += 1
     
     async def receive_commands(self, websocket):
         while self.running:
             message = await websocket.recv()
+            if isinstance(message, bytes):
+                # Binary frames carry media, commands are JSON text
+                continue
             data = json.loads(message)
             
-            if data['type'] == 'speech':
+            echo = data.get('echo')
+            if echo and echo.get('stream') in self.monitors:
+                self.monitors[echo['stream']].record(echo['seq'], echo['timestamp'])
+            
+            # Acks may carry only an echo
+            message_type = data.get('type')
+            if message_type == 'speech':
                 self.output.play_speech(data['text'])
-            elif data['type'] == 'control':
-                if data['command'] == 'stop':
+            elif message_type == 'control':
+                if data.get('command') == 'stop':
                     self.running = False
                 # Add more control commands as needed
     
@@ -60,4 +172,6 @@ class RaspberryPiClient:
 
 if __name__ == "__main__":
     client = RaspberryPiClient()
+    # kill -USR1 <pid> prints the latency and loss histograms
+    signal.signal(signal.SIGUSR1, lambda sig, frame: client.dump_latency())
     client.start()
\ No newline at end of file
@@ -1,7 +1,12 @@
-import pygame
 import numpy as np
 import io
 
+try:
+    import pygame
+except ImportError:
+    # Only needed on the Pi, see fake_devices.NullOutput
+    pygame = None
+
 class OutputManager:
     def __init__(self):
         pygame.mixer.init()
@@ -0,0 +1,121 @@
+import struct
+import numpy as np
+import audio_codec
+
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+
+# Binary media messages are sent as WebSocket binary frames:
+#   header (HEADER) followed by the payload bytes.
+# Control messages stay as JSON text frames.
+PROTOCOL_VERSION = 1
+
+STREAM_CAMERA = 1
+STREAM_AUDIO = 2
+
+CODEC_RAW = 0
+CODEC_JPEG = 1
+# Compressed audio, see audio_codec
+CODEC_ULAW = audio_codec.CODEC_ULAW
+CODEC_ADPCM = audio_codec.CODEC_ADPCM
+
+DTYPES = {
+    0: np.uint8,
+    1: np.int16,
+}
+DTYPE_CODES = {np.dtype(dtype): code for code, dtype in DTYPES.items()}
+
+# version, stream type, codec, dtype, sequence number, capture timestamp
+# (time.monotonic() on the Pi), shape (rows, columns, channels).
+# The server echoes stream, seq and timestamp back in JSON replies as
+# {"echo": {"stream": ..., "seq": ..., "timestamp": ...}}.
+HEADER = struct.Struct('!BBBBIdHHH')
+
+
+class MediaHeader:
+    def __init__(self, stream, codec, dtype, seq, timestamp, shape):
+        self.stream = stream
+        self.codec = codec
+        self.dtype = dtype
+        self.seq = seq
+        self.timestamp = timestamp
+        self.shape = shape
+
+
+def _pack_shape(shape):
+    shape = tuple(shape) + (1,) * (3 - len(shape))
+    return shape[:3]
+
+
+def _unpack_shape(stream, shape):
+    rows, columns, channels = shape
+    if stream == STREAM_AUDIO:
+        # Audio is stored as (samples, channels)
+        return (rows,) if columns == 1 else (rows, columns)
+    return (rows, columns) if channels == 1 else (rows, columns, channels)
+
+
+def encode_media(stream, array, seq, timestamp, codec=CODEC_RAW, quality=80):
+    """Encode a NumPy array as a binary media message"""
+    dtype_code = DTYPE_CODES[array.dtype]
+    if codec == CODEC_JPEG:
+        if cv2 is None:
+            raise RuntimeError("JPEG codec requires OpenCV")
+        ok, buffer = cv2.imencode('.jpg', array, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        if not ok:
+            raise RuntimeError("JPEG encoding failed")
+        payload = buffer.data
+    elif codec in (CODEC_ULAW, CODEC_ADPCM):
+        payload = audio_codec.get_codec(codec).encode(array.reshape(-1))
+    else:
+        payload = np.ascontiguousarray(array).data
+
+    header = HEADER.pack(PROTOCOL_VERSION, stream, codec, dtype_code,
+                         seq & 0xFFFFFFFF, timestamp, *_pack_shape(array.shape))
+    return b''.join((header, payload))
+
+
+def encode_camera(frame, seq, timestamp, quality=80):
+    """Encode a camera frame, JPEG-compressed when OpenCV is available"""
+    codec = CODEC_JPEG if cv2 is not None else CODEC_RAW
+    return encode_media(STREAM_CAMERA, frame, seq, timestamp, codec, quality)
+
+
+def encode_audio(samples, seq, timestamp, codec=CODEC_RAW):
+    """Encode a chunk of PCM samples, optionally mu-law or ADPCM compressed"""
+    return encode_media(STREAM_AUDIO, samples, seq, timestamp, codec)
+
+
+def decode_header(message):
+    """Parse the header of a binary media message"""
+    (version, stream, codec, dtype_code, seq,
+     timestamp, *shape) = HEADER.unpack_from(message)
+    if version != PROTOCOL_VERSION:
+        raise ValueError(f"Unsupported protocol version {version}")
+    return MediaHeader(stream, codec, DTYPES[dtype_code], seq, timestamp,
+                       _unpack_shape(stream, shape))
+
+
+def decode_media(message):
+    """Decode a binary media message into (header, array)
+
+    This is the receiving-side counterpart of encode_media, for use by the
+    PC server. Raw payloads are returned as read-only views of the message.
+    """
+    header = decode_header(message)
+    payload = memoryview(message)[HEADER.size:]
+
+    if header.codec == CODEC_JPEG:
+        if cv2 is None:
+            raise RuntimeError("JPEG codec requires OpenCV")
+        array = cv2.imdecode(np.frombuffer(payload, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+    elif header.codec in (CODEC_ULAW, CODEC_ADPCM):
+        array = audio_codec.get_codec(header.codec).decode(payload).reshape(header.shape)
+    elif header.codec == CODEC_RAW:
+        array = np.frombuffer(payload, dtype=header.dtype).reshape(header.shape)
+    else:
+        raise ValueError(f"Unsupported codec {header.codec}")
+
+    return header, array
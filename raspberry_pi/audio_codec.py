@@ -0,0 +1,184 @@
+# Identical copies live in raspberry_pi/ and raspberri_pi/, which are
+# each deployed on their own; change them together.
+import struct
+import numpy as np
+
+# Codec ids as they appear in stream headers
+CODEC_PCM = 0
+CODEC_ULAW = 2
+CODEC_ADPCM = 3
+
+# G.711 mu-law (encoder works on 14-bit samples, decoder on 16-bit)
+ULAW_BIAS = 0x21
+ULAW_CLIP = 8159
+ULAW_DECODE_BIAS = 0x84
+
+# IMA ADPCM tables
+STEP_TABLE = np.array([
+    7, 8, 9, 10, 11, 12, 13, 14, 16, 17, 19, 21, 23, 25, 28, 31, 34, 37, 41, 45,
+    50, 55, 60, 66, 73, 80, 88, 97, 107, 118, 130, 143, 157, 173, 190, 209, 230,
+    253, 279, 307, 337, 371, 408, 449, 494, 544, 598, 658, 724, 796, 876, 963,
+    1060, 1166, 1282, 1411, 1552, 1707, 1878, 2066, 2272, 2499, 2749, 3024, 3327,
+    3660, 4026, 4428, 4871, 5358, 5894, 6484, 7132, 7845, 8630, 9493, 10442,
+    11487, 12635, 13899, 15289, 16818, 18500, 20350, 22385, 24623, 27086, 29794,
+    32767], dtype=np.int32)
+INDEX_TABLE = np.array([-1, -1, -1, -1, 2, 4, 6, 8] * 2, dtype=np.int32)
+
+
+def _adpcm_tables():
+    magnitude = np.arange(8)
+    step = STEP_TABLE[:, None]
+    # Reconstructed difference for each (step index, 3-bit magnitude)
+    delta = ((step >> 3) + np.where(magnitude & 4, step, 0) +
+             np.where(magnitude & 2, step >> 1, 0) + np.where(magnitude & 1, step >> 2, 0))
+    # Step index after each (step index, 4-bit code)
+    next_index = np.clip(np.arange(89)[:, None] + INDEX_TABLE[None, :], 0, 88)
+    return delta.astype(np.int32), next_index.astype(np.int32)
+
+
+ADPCM_DELTA_TABLE, ADPCM_NEXT_INDEX = _adpcm_tables()
+
+
+def _ulaw_encode_formula(samples):
+    # Same arithmetic as the reference G.711 encoder, on 14-bit magnitudes
+    pcm = samples.astype(np.int32) >> 2
+    mask = np.where(pcm < 0, 0x7F, 0xFF)
+    pcm = np.minimum(np.abs(pcm), ULAW_CLIP) + ULAW_BIAS
+    segment = np.maximum(np.frexp(pcm)[1] - 6, 0)
+    value = (segment << 4) | ((pcm >> (segment + 1)) & 0x0F)
+    # Beyond the last segment: largest code
+    value = np.where(segment > 7, 0x7F, value)
+    return (value ^ mask).astype(np.uint8)
+
+
+def _ulaw_decode_formula(codes):
+    codes = ~codes.astype(np.int32) & 0xFF
+    exponent = (codes >> 4) & 0x07
+    mantissa = codes & 0x0F
+    magnitude = (((mantissa << 3) + ULAW_DECODE_BIAS) << exponent) - ULAW_DECODE_BIAS
+    return np.where(codes & 0x80, -magnitude, magnitude).astype(np.int16)
+
+
+# Lookup tables: encoding indexes by the sample's 16-bit pattern
+ULAW_ENCODE_TABLE = _ulaw_encode_formula(np.arange(65536, dtype=np.uint16).view(np.int16))
+ULAW_DECODE_TABLE = _ulaw_decode_formula(np.arange(256, dtype=np.uint8))
+
+
+class PcmCodec:
+    id = CODEC_PCM
+    name = 'pcm'
+
+    def encode(self, samples):
+        return np.ascontiguousarray(samples, dtype=np.int16).tobytes()
+
+    def decode(self, data):
+        return np.frombuffer(data, dtype=np.int16)
+
+
+class UlawCodec:
+    """G.711 mu-law, 8 bits per sample (2:1)"""
+    id = CODEC_ULAW
+    name = 'ulaw'
+
+    def encode(self, samples):
+        samples = np.asarray(samples, dtype=np.int16)
+        return ULAW_ENCODE_TABLE[samples.view(np.uint16)].tobytes()
+
+    def decode(self, data):
+        return ULAW_DECODE_TABLE[np.frombuffer(data, dtype=np.uint8)]
+
+
+class AdpcmCodec:
+    """IMA ADPCM, 4 bits per sample (close to 4:1)
+
+    The signal is split into independent blocks, each starting with its
+    first sample and step index, so all blocks are coded at once with
+    NumPy and only the position within a block is iterated in Python.
+
+    Encoded layout: sample count (uint32), then per block a header
+    (int16 first sample, uint8 step index, pad byte) followed by
+    block_size - 1 packed 4-bit codes.
+    """
+    id = CODEC_ADPCM
+    name = 'adpcm'
+
+    BLOCK_HEADER = struct.Struct('<hBx')
+
+    def __init__(self, block_size=64):
+        self.block_size = block_size
+        self.codes_per_block = block_size - 1
+        self.code_bytes = (self.codes_per_block + 1) // 2
+
+    def _blocks(self, samples):
+        count = len(samples)
+        blocks = max(1, -(-count // self.block_size))
+        padded = np.empty(blocks * self.block_size, dtype=np.int32)
+        padded[:count] = samples
+        padded[count:] = samples[-1] if count else 0
+        return padded.reshape(blocks, self.block_size)
+
+    @staticmethod
+    def _step(codes, predictor, index):
+        """Advance predictor and step index for one column of codes"""
+        delta = ADPCM_DELTA_TABLE[index, codes & 7]
+        predictor = predictor + np.where(codes & 8, -delta, delta)
+        np.clip(predictor, -32768, 32767, out=predictor)
+        return predictor, ADPCM_NEXT_INDEX[index, codes]
+
+    def encode(self, samples):
+        samples = np.asarray(samples, dtype=np.int16)
+        blocks = self._blocks(samples)
+        count = len(blocks)
+
+        predictor = blocks[:, 0].copy()
+        # Start each block with a step close to its opening sample deltas
+        opening = np.abs(np.diff(blocks[:, :9], axis=1)).mean(axis=1)
+        index = np.clip(np.searchsorted(STEP_TABLE, opening), 0, 88).astype(np.int32)
+        start_index = index.copy()
+
+        codes = np.zeros((count, self.code_bytes * 2), dtype=np.uint8)
+        for position in range(1, self.block_size):
+            diff = blocks[:, position] - predictor
+            # 3-bit magnitude of diff in quarter steps, plus sign bit
+            magnitude = np.minimum(4 * np.abs(diff) // STEP_TABLE[index], 7)
+            code = magnitude | ((diff < 0) << 3)
+            codes[:, position - 1] = code
+            predictor, index = self._step(code, predictor, index)
+
+        packed = codes[:, 0::2] | (codes[:, 1::2] << 4)
+        header = np.zeros((count, self.BLOCK_HEADER.size), dtype=np.uint8)
+        header[:, 0:2] = blocks[:, 0].astype('<i2').view(np.uint8).reshape(count, 2)
+        header[:, 2] = start_index
+        body = np.concatenate([header, packed], axis=1)
+        return struct.pack('<I', len(samples)) + body.tobytes()
+
+    def decode(self, data):
+        count, = struct.unpack_from('<I', data)
+        block_bytes = self.BLOCK_HEADER.size + self.code_bytes
+        body = np.frombuffer(data, dtype=np.uint8, offset=4).reshape(-1, block_bytes)
+
+        predictor = body[:, 0:2].copy().view('<i2')[:, 0].astype(np.int32)
+        index = body[:, 2].astype(np.int32)
+        packed = body[:, self.BLOCK_HEADER.size:]
+        codes = np.empty((len(body), self.code_bytes * 2), dtype=np.uint8)
+        codes[:, 0::2] = packed & 0x0F
+        codes[:, 1::2] = packed >> 4
+
+        out = np.empty((len(body), self.block_size), dtype=np.int16)
+        out[:, 0] = predictor
+        for position in range(1, self.block_size):
+            predictor, index = self._step(codes[:, position - 1].astype(np.int32),
+                                          predictor, index)
+            out[:, position] = predictor
+        return out.reshape(-1)[:count]
+
+
+CODECS = {codec.name: codec for codec in (PcmCodec, UlawCodec, AdpcmCodec)}
+CODECS_BY_ID = {codec.id: codec for codec in CODECS.values()}
+
+
+def get_codec(name):
+    """Return a codec instance by name ('pcm', 'ulaw' or 'adpcm') or id"""
+    if isinstance(name, int):
+        return CODECS_BY_ID[name]()
+    return CODECS[name]()
@@ -0,0 +1,195 @@
+# Identical copies live in raspberry_pi/ and raspberri_pi/, which are
+# each deployed on their own; change them together.
+import threading
+import time
+import numpy as np
+
+try:
+    import pyaudio
+except ImportError:
+    # Only needed for the Pi microphone, see AudioCapture's microphone argument
+    pyaudio = None
+
+
+class AudioRing:
+    """Fixed ring of int16 samples, filled by the capture callback
+
+    The buffer holds every frame twice, at i and i + capacity, so any span
+    of up to capacity frames is contiguous and read() returns it as a view
+    without copying. Positions count frames since capture started and are
+    the stream's sample clock; time_of() maps them to time.monotonic().
+
+    Frames not yet read when the writer laps the reader are lost and
+    counted as an overrun. A read that times out before enough frames
+    arrive is an underrun. A view stays valid until the writer comes
+    round again, capacity frames later.
+    """
+
+    def __init__(self, capacity, rate, channels=1):
+        self.capacity = capacity
+        self.rate = rate
+        self.channels = channels
+        # Interleaved samples, two copies of capacity frames
+        self.buffer = np.zeros(2 * capacity * channels, dtype=np.int16)
+        self.condition = threading.Condition()
+        # Frames written and read since the start, i.e. the sample clock
+        self.written = 0
+        self.read_position = 0
+        # monotonic() time of the frame at anchor_position
+        self.anchor_position = 0
+        self.anchor_time = None
+        self.overruns = 0
+        self.lost = 0
+        self.underruns = 0
+        self.device_overflows = 0
+        self.closed = False
+
+    def write(self, data, now=None, overflow=False):
+        """Append captured samples; now is when the last of them arrived"""
+        if now is None:
+            now = time.monotonic()
+        samples = np.frombuffer(data, dtype=np.int16)
+        count = len(samples) // self.channels
+        # More than a whole ring at once: only the newest capacity frames fit
+        kept = min(count, self.capacity)
+        samples = samples[(count - kept) * self.channels:count * self.channels]
+        with self.condition:
+            if self.anchor_time is None or overflow:
+                # The device dropped samples, so the sample clock restarts here
+                self.anchor_position = self.written
+                self.anchor_time = now - count / self.rate
+            if overflow:
+                self.device_overflows += 1
+
+            start = (self.written + count - kept) % self.capacity
+            first = min(kept, self.capacity - start)
+            for offset, part in ((start, samples[:first * self.channels]),
+                                 (0, samples[first * self.channels:])):
+                if len(part):
+                    for copy in (offset, offset + self.capacity):
+                        begin = copy * self.channels
+                        self.buffer[begin:begin + len(part)] = part
+            self.written += count
+
+            unread = self.written - self.read_position
+            if unread > self.capacity:
+                self.overruns += 1
+                self.lost += unread - self.capacity
+                self.read_position = self.written - self.capacity
+            self.condition.notify_all()
+
+    def read(self, count, timeout=None):
+        """Next count unread frames as (position, view), or None on timeout
+
+        The view holds the frames' samples interleaved, as PyAudio delivers them.
+        """
+        if count > self.capacity:
+            raise ValueError(f"Cannot read {count} frames from a ring of {self.capacity}")
+        with self.condition:
+            ready = self.condition.wait_for(
+                lambda: self.written - self.read_position >= count or self.closed, timeout)
+            if self.closed:
+                return None
+            if not ready:
+                self.underruns += 1
+                return None
+            position = self.read_position
+            self.read_position += count
+        start = (position % self.capacity) * self.channels
+        return position, self.buffer[start:start + count * self.channels]
+
+    def time_of(self, position):
+        """monotonic() capture time of the frame at position"""
+        with self.condition:
+            if self.anchor_time is None:
+                return time.monotonic()
+            return self.anchor_time + (position - self.anchor_position) / self.rate
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    def stats(self):
+        with self.condition:
+            return {
+                'clock': self.written,
+                'buffered': self.written - self.read_position,
+                'overruns': self.overruns,
+                'lost_samples': self.lost,
+                'underruns': self.underruns,
+                'device_overflows': self.device_overflows,
+            }
+
+
+class AudioCapture:
+    """PyAudio in callback mode writing into an AudioRing
+
+    PortAudio calls back on its own thread with each buffer, which is
+    copied into the ring. A microphone object with a blocking
+    read(frames, exception_on_overflow) (e.g. fake_devices.SyntheticMicrophone)
+    can be given instead; it is then read on a thread that feeds the ring
+    the same way.
+    """
+
+    def __init__(self, rate=16000, channels=1, chunk=1024, ring_seconds=4, microphone=None):
+        self.rate = rate
+        self.channels = channels
+        self.chunk = chunk
+        self.ring = AudioRing(int(ring_seconds * rate), rate, channels)
+        self.microphone = microphone
+        self.audio = None
+        self.stream = None
+        self.thread = None
+        self.running = False
+
+    def start(self):
+        self.running = True
+        self.ring.closed = False
+        if self.microphone is not None:
+            self.thread = threading.Thread(target=self._read_loop)
+            self.thread.daemon = True
+            self.thread.start()
+            return
+        self.audio = pyaudio.PyAudio()
+        self.stream = self.audio.open(format=pyaudio.paInt16, channels=self.channels,
+                                      rate=self.rate, input=True,
+                                      frames_per_buffer=self.chunk,
+                                      stream_callback=self._callback)
+        self.stream.start_stream()
+
+    def stop(self):
+        if not self.running:
+            return
+        self.running = False
+        self.ring.close()
+        if self.stream is not None:
+            self.stream.stop_stream()
+            self.stream.close()
+            self.audio.terminate()
+            self.stream = None
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        if self.microphone is not None:
+            self.microphone.close()
+
+    def read(self, count=None, timeout=1.0):
+        """Next samples as (capture time, view), or None on timeout"""
+        item = self.ring.read(count or self.chunk, timeout)
+        if item is None:
+            return None
+        position, samples = item
+        return self.ring.time_of(position), samples
+
+    def stats(self):
+        return self.ring.stats()
+
+    def _callback(self, in_data, frame_count, time_info, status):
+        self.ring.write(in_data, overflow=bool(status & pyaudio.paInputOverflow))
+        return None, pyaudio.paContinue
+
+    def _read_loop(self):
+        while self.running:
+            data = self.microphone.read(self.chunk, exception_on_overflow=False)
+            self.ring.write(data)
@@ -1,44 +1,178 @@
-import pyaudio
 import socket
 import threading
+import struct
+import time
+import collections
+from mux import CHANNEL_AUDIO
+from audio_ring import AudioCapture
+from audio_codec import get_codec
+from connection import ReconnectingConnection, STAMP
+from latency import StreamMonitor
+from metrics import REGISTRY
+
+# Sent once at the start of every audio stream, before the chunks:
+# magic, codec id, sample rate, channels, sample width.
+# Each chunk then starts with a STAMP (sequence number, capture time of
+# its first sample).
+STREAM_HEADER = struct.Struct('!4sBIBB')
+STREAM_MAGIC = b'PIAU'
+# Samples are captured as 16-bit PCM
+SAMPLE_WIDTH = 2
+
+ENCODE_TIME = REGISTRY.timer('audio_encode_seconds', 'Time to encode one chunk')
+SEND_TIME = REGISTRY.timer('audio_send_seconds', 'Time blocked sending one chunk')
+BYTES_SENT = REGISTRY.counter('audio_sent_bytes', 'Audio bytes sent, including framing')
 
 class AudioStream:
-    def __init__(self, server_ip='192.168.1.100', server_port=8001):
+    def __init__(self, server_ip='192.168.1.100', server_port=8001, mux=None, codec='pcm',
+                 backlog_seconds=30, replay_speed=4.0, microphone=None):
         self.server_ip = server_ip
         self.server_port = server_port
+        # Optional shared MuxConnection used instead of a dedicated socket
+        self.mux = mux
         self.running = False
+        self.threads = []
         self.chunk = 1024
-        self.format = pyaudio.paInt16
         self.channels = 1
         self.rate = 16000
+        # 'pcm', 'ulaw' or 'adpcm'; announced in the stream header
+        self.codec = get_codec(codec)
+        self.header = STREAM_HEADER.pack(STREAM_MAGIC, self.codec.id, self.rate, self.channels,
+                                         SAMPLE_WIDTH)
+        # Callback-mode capture into a ring buffer. microphone is an object
+        # with read(frames, exception_on_overflow) and close(), used instead
+        # of PyAudio (e.g. fake_devices.SyntheticMicrophone)
+        self.capture = AudioCapture(self.rate, self.channels, self.chunk, microphone=microphone)
+        
+        # Encoded chunks waiting to be sent; holds up to backlog_seconds of
+        # audio while disconnected and is replayed at most replay_speed x
+        # real time once the connection is back
+        self.backlog = collections.deque()
+        self.backlog_limit = int(backlog_seconds * self.rate / self.chunk)
+        self.replay_speed = replay_speed
+        self.condition = threading.Condition()
+        self.dropped = 0
+        # Latency and loss from the stamps echoed back by the server
+        self.monitor = StreamMonitor('audio')
+        REGISTRY.add_stats('audio', self.stats,
+                           counters=('dropped', 'reconnects', 'overruns', 'lost_samples',
+                                     'underruns', 'device_overflows'))
+        self.connection = None
+        if not mux:
+            self.connection = ReconnectingConnection(server_ip, server_port,
+                                                     on_connect=self._send_header)
         
     def start(self):
         self.running = True
-        self.thread = threading.Thread(target=self._stream_loop)
-        self.thread.daemon = True
-        self.thread.start()
+        targets = [self._capture_loop, self._stream_loop]
+        if self.connection:
+            # With the mux, echoes arrive on its control channel instead
+            targets.append(self._echo_loop)
+        for target in targets:
+            thread = threading.Thread(target=target)
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
         
     def stop(self):
         self.running = False
-        if self.thread:
-            self.thread.join()
-            
+        # Also wakes the capture loop from its read
+        self.capture.stop()
+        if self.connection:
+            self.connection.close()
+        with self.condition:
+            self.condition.notify_all()
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+    
+    def stats(self):
+        with self.condition:
+            stats = {'backlog': len(self.backlog), 'dropped': self.dropped}
+        stats.update(self.capture.stats())
+        if self.connection:
+            stats.update(self.connection.stats())
+        stats['echo'] = self.monitor.stats()
+        return stats
+    
+    def _send_header(self, sock):
+        # Every new connection starts a new stream
+        sock.sendall(self.header)
+    
+    def _echo_loop(self):
+        while self.running:
+            data = self.connection.receive(STAMP.size)
+            if data is None:
+                time.sleep(0.1)
+                continue
+            self.monitor.record(*STAMP.unpack(data))
+    
+    def _capture_loop(self):
+        self.capture.start()
+        seq = 0
+        try:
+            while self.running:
+                # A view into the ring, stamped from its sample clock
+                item = self.capture.read(self.chunk)
+                if item is None:
+                    continue
+                timestamp, samples = item
+                seq += 1
+                with ENCODE_TIME.time():
+                    data = self.codec.encode(samples)
+                with self.condition:
+                    if len(self.backlog) >= self.backlog_limit:
+                        self.backlog.popleft()
+                        self.dropped += 1
+                    self.backlog.append(STAMP.pack(seq, timestamp) + data)
+                    self.condition.notify()
+        finally:
+            self.capture.stop()
+    
     def _stream_loop(self):
-        audio = pyaudio.PyAudio()
-        stream = audio.open(format=self.format, channels=self.channels,
-                            rate=self.rate, input=True,
-                            frames_per_buffer=self.chunk)
-        
-        client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        client_socket.connect((self.server_ip, self.server_port))
+        if self.mux:
+            # Also opens the audio channel again after a reconnect
+            self.mux.set_header(CHANNEL_AUDIO, self.header)
+        chunk_duration = self.chunk / self.rate
+        last_send = 0.0
         
         try:
             while self.running:
-                data = stream.read(self.chunk)
-                client_socket.sendall(len(data).to_bytes(4, byteorder='big'))
-                client_socket.sendall(data)
+                if self.connection and not self.connection.connected:
+                    if not self.connection.connect():
+                        break
+                
+                with self.condition:
+                    self.condition.wait_for(lambda: self.backlog or not self.running, 0.5)
+                    if not self.backlog:
+                        continue
+                    data = self.backlog[0]
+                    behind = len(self.backlog) > 1
+                
+                if behind:
+                    # Replaying a backlog: faster than real time, but capped
+                    delay = last_send + chunk_duration / self.replay_speed - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                
+                start = time.monotonic()
+                if self.mux:
+                    self.mux.send(CHANNEL_AUDIO, data)
+                    BYTES_SENT.inc(len(data))
+                else:
+                    try:
+                        self.connection.sendall(len(data).to_bytes(4, byteorder='big') + data)
+                    except ConnectionError as e:
+                        # The chunk stays in the backlog for the next connection
+                        print(f"Audio stream: {e}")
+                        continue
+                    BYTES_SENT.inc(len(data) + 4)
+                last_send = time.monotonic()
+                SEND_TIME.observe(last_send - start)
+                
+                with self.condition:
+                    if self.backlog and self.backlog[0] is data:
+                        self.backlog.popleft()
         finally:
-            stream.stop_stream()
-            stream.close()
-            audio.terminate()
-            client_socket.close()
+            if self.connection:
+                self.connection.close()
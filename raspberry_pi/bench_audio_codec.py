@@ -0,0 +1,48 @@
+# bench_audio_codec.py - CPU cost and compression ratio of the audio codecs
+import sys
+import time
+import numpy as np
+from audio_codec import CODECS, get_codec
+from fake_devices import synthetic_speech
+
+RATE = 16000
+SECONDS = 10
+CHUNK = 1024
+
+
+def snr_db(reference, decoded):
+    reference = reference.astype(np.float64)
+    noise = np.mean((reference - decoded.astype(np.float64)) ** 2)
+    if noise == 0:
+        return float('inf')
+    return 10 * np.log10(np.mean(reference ** 2) / noise)
+
+
+def main():
+    samples = synthetic_speech(SECONDS, RATE)
+    chunks = [samples[i:i + CHUNK] for i in range(0, len(samples), CHUNK)]
+
+    print(f"{len(samples) / RATE:.0f} s of {RATE} Hz audio in {CHUNK}-sample chunks "
+          f"({sys.platform}, numpy {np.__version__})")
+    print(f"{'codec':<8} {'ratio':>6} {'kbit/s':>8} {'enc ms/s':>9} {'dec ms/s':>9} "
+          f"{'enc CPU':>8} {'SNR dB':>7}")
+    for name in CODECS:
+        codec = get_codec(name)
+
+        start = time.process_time()
+        encoded = [codec.encode(chunk) for chunk in chunks]
+        encode_time = time.process_time() - start
+
+        start = time.process_time()
+        decoded = np.concatenate([codec.decode(data) for data in encoded])
+        decode_time = time.process_time() - start
+
+        size = sum(len(data) for data in encoded)
+        seconds = len(samples) / RATE
+        print(f"{name:<8} {samples.nbytes / size:>6.2f} {8 * size / seconds / 1000:>8.1f} "
+              f"{1000 * encode_time / seconds:>9.2f} {1000 * decode_time / seconds:>9.2f} "
+              f"{100 * encode_time / seconds:>7.2f}% {snr_db(samples, decoded):>7.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+# bench_harness.py - Result rows, table and command line shared by the bench_stream scripts
+# Identical copies live in client/, raspberry_pi/ and raspberri_pi/, which are
+# each deployed on their own; change them together.
+import argparse
+import json
+
+# Seconds a stream runs before measuring starts
+WARMUP = 1.0
+
+
+def result(name, messages, size, cpu, elapsed, latency):
+    """One result row; latency is a latency.Histogram in microseconds"""
+    return {
+        'variant': name,
+        'fps': messages / elapsed,
+        'bytes_per_s': size / elapsed,
+        'cpu_ms_per_frame': 1000 * cpu / messages if messages else 0.0,
+        'cpu_percent': 100 * cpu / elapsed,
+        'p50_ms': latency.percentile(50) / 1000,
+        'p99_ms': latency.percentile(99) / 1000,
+    }
+
+
+def print_table(results):
+    width = max([len('variant')] + [len(r['variant']) for r in results])
+    print(f"{'variant':<{width}} {'fps':>7} {'KB/s':>9} {'CPU ms/f':>9} {'CPU %':>6} "
+          f"{'p50 ms':>7} {'p99 ms':>7}")
+    for r in results:
+        print(f"{r['variant']:<{width}} {r['fps']:>7.1f} {r['bytes_per_s'] / 1024:>9.1f} "
+              f"{r['cpu_ms_per_frame']:>9.2f} {r['cpu_percent']:>6.1f} "
+              f"{r['p50_ms']:>7.1f} {r['p99_ms']:>7.1f}")
+
+
+def main(description, variants):
+    """Run the variants named on the command line; each returns a row or a list of rows"""
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('--seconds', type=float, default=5.0)
+    parser.add_argument('--json', action='store_true', help="Print results as JSON")
+    parser.add_argument('variants', nargs='*',
+                        help=f"Variants to run: {', '.join(variants)} (default: all)")
+    args = parser.parse_args()
+    unknown = set(args.variants) - set(variants)
+    if unknown:
+        parser.error(f"Unknown variants: {', '.join(sorted(unknown))}")
+
+    results = []
+    for name in args.variants or variants:
+        rows = variants[name](args.seconds)
+        results += rows if isinstance(rows, list) else [rows]
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_table(results)
@@ -0,0 +1,107 @@
+# bench_stream.py - Camera and audio streams against a loopback receiver, no Pi hardware needed
+import socket
+import threading
+import time
+from camera_stream import CameraStream
+from audio_stream import AudioStream, STREAM_HEADER
+from connection import STAMP
+from latency import Histogram
+from fake_devices import SyntheticCamera, SyntheticMicrophone
+from bench_harness import WARMUP, result, main
+
+
+class LoopbackReceiver:
+    """Stands in for the PC server on one stream port
+
+    Reads length-prefixed messages (after an optional stream header),
+    measures capture-to-receive latency from each message's STAMP and
+    echoes the STAMP back, as the server does.
+    """
+
+    def __init__(self, header_size=0):
+        self.header_size = header_size
+        self.server = socket.create_server(('127.0.0.1', 0))
+        self.port = self.server.getsockname()[1]
+        self.conn = None
+        self.thread = None
+        self.messages = 0
+        self.bytes = 0
+        self.cpu = 0.0
+        self.latency = Histogram()
+
+    def start(self):
+        self.thread = threading.Thread(target=self._receive_loop)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.server.close()
+        if self.conn:
+            self.conn.close()
+        self.thread.join()
+
+    def _receive_loop(self):
+        start_cpu = time.thread_time()
+        try:
+            self.conn, _ = self.server.accept()
+            reader = self.conn.makefile('rb')
+            reader.read(self.header_size)
+            while True:
+                prefix = reader.read(4)
+                if len(prefix) < 4:
+                    break
+                message = reader.read(int.from_bytes(prefix, byteorder='big'))
+                seq, timestamp = STAMP.unpack_from(message)
+                self.latency.record((time.monotonic() - timestamp) * 1e6)
+                self.conn.sendall(message[:STAMP.size])
+                self.messages += 1
+                self.bytes += len(prefix) + len(message)
+                self.cpu = time.thread_time() - start_cpu
+        except (OSError, ValueError):
+            pass
+
+
+def measure(name, stream, receiver, seconds):
+    """Run stream against receiver; CPU is the process total minus the receiver's"""
+    receiver.start()
+    stream.start()
+    time.sleep(WARMUP)
+
+    messages, size, receiver_cpu = receiver.messages, receiver.bytes, receiver.cpu
+    receiver.latency = Histogram()
+    start, start_cpu = time.monotonic(), time.process_time()
+    time.sleep(seconds)
+    elapsed = time.monotonic() - start
+    cpu = time.process_time() - start_cpu - (receiver.cpu - receiver_cpu)
+    messages = receiver.messages - messages
+    size = receiver.bytes - size
+    latency = receiver.latency
+
+    stream.stop()
+    receiver.stop()
+    return result(name, messages, size, cpu, elapsed, latency)
+
+
+def bench_camera(seconds, fps=30):
+    receiver = LoopbackReceiver()
+    stream = CameraStream('127.0.0.1', receiver.port, fps=fps,
+                          camera=SyntheticCamera(640, 480, fps))
+    return measure(f'camera-{fps}fps', stream, receiver, seconds)
+
+
+def bench_audio(seconds, codec):
+    receiver = LoopbackReceiver(STREAM_HEADER.size)
+    stream = AudioStream('127.0.0.1', receiver.port, codec=codec,
+                         microphone=SyntheticMicrophone())
+    return measure(f'audio-{codec}', stream, receiver, seconds)
+
+
+VARIANTS = {
+    'camera': bench_camera,
+    'audio-pcm': lambda seconds: bench_audio(seconds, 'pcm'),
+    'audio-adpcm': lambda seconds: bench_audio(seconds, 'adpcm'),
+}
+
+
+if __name__ == "__main__":
+    main("Benchmark the streams against a loopback receiver", VARIANTS)
@@ -1,53 +1,262 @@
-from picamera2 import Picamera2
 import socket
 import threading
 import time
+import queue
 import cv2
 import numpy as np
 import io
+from congestion import AdaptiveController, unsent_bytes
+from mux import CHANNEL_VIDEO
+from connection import ReconnectingConnection, STAMP
+from latency import StreamMonitor
+from metrics import REGISTRY
+
+try:
+    from picamera2 import Picamera2
+except ImportError:
+    # Only needed for the Pi camera; any object with the same
+    # start/stop/capture_array methods can be passed as camera
+    Picamera2 = None
+
+CAPTURE_TIME = REGISTRY.timer('camera_capture_seconds', 'Time to capture one frame')
+ENCODE_TIME = REGISTRY.timer('camera_encode_seconds', 'Time to resize and JPEG-encode one frame')
+SEND_TIME = REGISTRY.timer('camera_send_seconds', 'Time blocked sending one frame')
+BYTES_SENT = REGISTRY.counter('camera_sent_bytes', 'Frame bytes sent, including framing')
+
+def put_latest(q, item):
+    """Put item on a bounded queue, discarding the oldest entries if it is full.
+    Returns the number of entries discarded."""
+    dropped = 0
+    while True:
+        try:
+            q.put_nowait(item)
+            return dropped
+        except queue.Full:
+            try:
+                q.get_nowait()
+                dropped += 1
+            except queue.Empty:
+                pass
 
 class CameraStream:
-    def __init__(self, server_ip='192.168.1.100', server_port=8000):
+    def __init__(self, server_ip='192.168.1.100', server_port=8000, fps=30,
+                 encoders=2, quality=80, queue_size=2, report_interval=10,
+                 adaptive=True, target_latency=0.2, mux=None, camera=None):
         self.server_ip = server_ip
         self.server_port = server_port
+        # Optional shared MuxConnection used instead of a dedicated socket
+        self.mux = mux
+        self.connection = None if mux else ReconnectingConnection(server_ip, server_port)
+        self.fps = fps
+        self.encoders = encoders
+        self.quality = quality
+        self.report_interval = report_interval
+        # Lowers quality, resolution and frame rate when the link backs up
+        self.controller = None
+        if adaptive:
+            self.controller = AdaptiveController(target_latency, max_quality=quality,
+                                                 max_fps=fps)
         self.running = False
-        self.picam2 = None
-        
+        # A camera passed in (e.g. fake_devices.SyntheticCamera) is used as configured
+        self.picam2 = camera
+        self.threads = []
+
+        # capture -> encode -> send, each queue drops its oldest frame when full
+        self.raw_queue = queue.Queue(maxsize=queue_size)
+        self.send_queue = queue.Queue(maxsize=queue_size)
+
+        self.captured = 0
+        self.sent = 0
+        self.dropped = 0
+        self.encoded = 0
+        self.encode_time = 0.0
+        self.stats_lock = threading.Lock()
+        # Latency and loss from the stamps echoed back by the server
+        self.monitor = StreamMonitor('camera')
+        REGISTRY.add_stats('camera', self.stats,
+                           counters=('captured', 'encoded', 'sent', 'dropped', 'reconnects'))
+
     def initialize(self):
         self.picam2 = Picamera2()
         config = self.picam2.create_preview_configuration(main={"size": (640, 480)})
         self.picam2.configure(config)
-        
+
     def start(self):
         if self.picam2 is None:
             self.initialize()
-            
+
         self.picam2.start()
         self.running = True
-        self.thread = threading.Thread(target=self._stream_loop)
-        self.thread.daemon = True
-        self.thread.start()
-        
+        targets = [self._capture_loop, self._stream_loop]
+        targets += [self._encode_loop] * self.encoders
+        if self.connection:
+            # With the mux, echoes arrive on its control channel instead
+            targets.append(self._echo_loop)
+        for target in targets:
+            thread = threading.Thread(target=target)
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
     def stop(self):
         self.running = False
-        if self.thread:
-            self.thread.join()
+        if self.connection:
+            self.connection.close()
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
         if self.picam2:
             self.picam2.stop()
-            
+
+    def stats(self):
+        with self.stats_lock:
+            stats = {
+                'captured': self.captured,
+                'encoded': self.encoded,
+                'sent': self.sent,
+                'dropped': self.dropped,
+                'encode_ms': 1000 * self.encode_time / self.encoded if self.encoded else 0.0,
+                'raw_queue': self.raw_queue.qsize(),
+                'send_queue': self.send_queue.qsize(),
+            }
+        if self.connection:
+            stats.update(self.connection.stats())
+        stats['echo'] = self.monitor.stats()
+        return stats
+
+    def _capture_loop(self):
+        deadline = time.monotonic()
+        seq = 0
+        while self.running:
+            with CAPTURE_TIME.time():
+                frame = self.picam2.capture_array()
+            timestamp = time.monotonic()
+            seq += 1
+            dropped = put_latest(self.raw_queue, (seq, timestamp, frame))
+            with self.stats_lock:
+                self.captured += 1
+                self.dropped += dropped
+
+            # Pace on frame deadlines rather than a fixed sleep
+            if self.controller:
+                deadline += self.controller.frame_interval
+            else:
+                deadline += 1.0 / self.fps
+            delay = deadline - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                # Running late: start a new schedule instead of bursting
+                deadline = time.monotonic()
+
+    def _encode_loop(self):
+        while self.running:
+            try:
+                seq, timestamp, frame = self.raw_queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            quality = self.quality
+            start = time.monotonic()
+            if self.controller:
+                quality = self.controller.quality
+                frame = self.controller.resize(frame)
+            # Convert to jpg for efficient streaming
+            _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+            elapsed = time.monotonic() - start
+            ENCODE_TIME.observe(elapsed)
+            dropped = put_latest(self.send_queue, (seq, timestamp, buffer))
+            with self.stats_lock:
+                self.encoded += 1
+                self.encode_time += elapsed
+                self.dropped += dropped
+
+    def _send(self, seq, timestamp, buffer):
+        # Every frame is prefixed with its capture sequence number and time
+        message = STAMP.pack(seq, timestamp) + buffer.tobytes()
+        if self.mux:
+            # The mux frames the message and schedules it behind audio
+            self.mux.send(CHANNEL_VIDEO, message)
+            BYTES_SENT.inc(len(message))
+            if self.controller:
+                self.controller.observe_latency(self.mux.recent_latency(CHANNEL_VIDEO))
+            return
+
+        # Send size followed by frame data
+        start = time.monotonic()
+        self.connection.sendall(len(message).to_bytes(4, byteorder='big') + message)
+        blocked = time.monotonic() - start
+        SEND_TIME.observe(blocked)
+        BYTES_SENT.inc(len(message) + 4)
+        if self.controller:
+            self.controller.observe_send(blocked, len(message) + 4,
+                                         unsent_bytes(self.connection.sock))
+
+    def _echo_loop(self):
+        while self.running:
+            data = self.connection.receive(STAMP.size)
+            if data is None:
+                time.sleep(0.1)
+                continue
+            self.monitor.record(*STAMP.unpack(data))
+
+    def _reconnect(self):
+        if not self.connection.connect():
+            return False
+        # Only the newest frame captured while disconnected is worth sending
+        while self.send_queue.qsize() > 1:
+            try:
+                self.send_queue.get_nowait()
+            except queue.Empty:
+                break
+            with self.stats_lock:
+                self.dropped += 1
+        return True
+
     def _stream_loop(self):
-        client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        client_socket.connect((self.server_ip, self.server_port))
-        
+        last_seq = 0
+        last_report = time.monotonic()
+        last_sent = 0
+
         try:
             while self.running:
-                frame = self.picam2.capture_array()
-                # Convert to jpg for efficient streaming
-                _, buffer = cv2.imencode('.jpg', frame)
-                size = len(buffer)
-                # Send size followed by frame data
-                client_socket.sendall(size.to_bytes(4, byteorder='big'))
-                client_socket.sendall(buffer)
-                time.sleep(0.03)  # ~30 FPS
+                if self.connection and not self.connection.connected:
+                    if not self._reconnect():
+                        break
+                try:
+                    seq, timestamp, buffer = self.send_queue.get(timeout=0.5)
+                except queue.Empty:
+                    continue
+                if seq <= last_seq:
+                    # An encoder finished an older frame after a newer one
+                    with self.stats_lock:
+                        self.dropped += 1
+                    continue
+                last_seq = seq
+
+                try:
+                    self._send(seq, timestamp, buffer)
+                except ConnectionError as e:
+                    print(f"Camera stream: {e}")
+                    continue
+                with self.stats_lock:
+                    self.sent += 1
+
+                now = time.monotonic()
+                if now - last_report >= self.report_interval:
+                    stats = self.stats()
+                    fps = (stats['sent'] - last_sent) / (now - last_report)
+                    print(f"Camera: {fps:.1f} fps, encode {stats['encode_ms']:.1f} ms, "
+                          f"queues {stats['raw_queue']}/{stats['send_queue']}, "
+                          f"dropped {stats['dropped']}")
+                    if self.controller:
+                        print(f"Camera: quality {self.controller.quality}, "
+                              f"scale {self.controller.scale}, fps {self.controller.fps}")
+                    echo = stats['echo']
+                    if echo['received']:
+                        print(f"Camera: latency p50 {echo['latency_ms'][50]:.0f} ms, "
+                              f"p99 {echo['latency_ms'][99]:.0f} ms, loss {100 * echo['loss']:.1f}%")
+                    last_report = now
+                    last_sent = stats['sent']
         finally:
-            client_socket.close()
\ No newline at end of file
+            if self.connection:
+                self.connection.close()
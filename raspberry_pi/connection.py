@@ -0,0 +1,133 @@
+import random
+import socket
+import struct
+import threading
+import time
+
+# Prefixed to every media message on a stream connection, and echoed back
+# by the server for each message it has processed:
+# sequence number, capture timestamp (time.monotonic() on the Pi)
+STAMP = struct.Struct('!Id')
+
+
+class ReconnectingConnection:
+    """TCP connection to the server that reconnects with exponential backoff
+
+    Each delay between attempts is jittered so a fleet of Pis does not
+    reconnect in lockstep after a server restart. on_connect(sock) runs
+    after every successful connect, e.g. to send a stream header.
+    """
+
+    def __init__(self, server_ip, server_port, on_connect=None,
+                 initial_delay=0.5, max_delay=30.0, connect_timeout=5.0):
+        self.server_ip = server_ip
+        self.server_port = server_port
+        self.on_connect = on_connect
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.connect_timeout = connect_timeout
+        self.sock = None
+        self.closed = threading.Event()
+        self.lock = threading.Lock()
+
+        self.connects = 0
+        self.reconnects = 0
+        self.disconnected_since = time.monotonic()
+        self.disconnected_total = 0.0
+
+    @property
+    def connected(self):
+        return self.sock is not None
+
+    def connect(self):
+        """Block until connected or close() is called; returns True when connected"""
+        delay = self.initial_delay
+        while not self.closed.is_set():
+            try:
+                sock = socket.create_connection((self.server_ip, self.server_port),
+                                                timeout=self.connect_timeout)
+                sock.settimeout(None)
+                if self.on_connect:
+                    self.on_connect(sock)
+            except OSError as e:
+                print(f"Connection to {self.server_ip}:{self.server_port} failed: {e}, "
+                      f"retrying in {delay:.1f}s")
+                self.closed.wait(delay * random.uniform(0.5, 1.5))
+                delay = min(delay * 2, self.max_delay)
+                continue
+
+            with self.lock:
+                self.sock = sock
+                self.disconnected_total += time.monotonic() - self.disconnected_since
+                if self.connects:
+                    self.reconnects += 1
+                self.connects += 1
+            return True
+        return False
+
+    def sendall(self, data):
+        """Send data, marking the connection as lost if that fails"""
+        sock = self.sock
+        if sock is None:
+            raise ConnectionError("Not connected")
+        try:
+            sock.sendall(data)
+        except OSError as e:
+            self.disconnect()
+            raise ConnectionError(f"Connection lost: {e}") from e
+
+    def receive(self, size):
+        """Read exactly size bytes from the current connection
+
+        Returns None when not connected or when the connection drops, which
+        also marks it as lost.
+        """
+        sock = self.sock
+        if sock is None:
+            return None
+        data = bytearray(size)
+        view = memoryview(data)
+        try:
+            while len(view):
+                received = sock.recv_into(view)
+                if not received:
+                    raise ConnectionError("Connection closed by server")
+                view = view[received:]
+        except OSError:
+            with self.lock:
+                current = self.sock is sock
+            if current:
+                self.disconnect()
+            return None
+        return bytes(data)
+
+    def disconnect(self):
+        with self.lock:
+            if self.sock is None:
+                return
+            try:
+                # Wakes a thread blocked in receive()
+                self.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+            self.sock = None
+            self.disconnected_since = time.monotonic()
+
+    def close(self):
+        self.closed.set()
+        self.disconnect()
+
+    def stats(self):
+        with self.lock:
+            disconnected = self.disconnected_total
+            if self.sock is None:
+                disconnected += time.monotonic() - self.disconnected_since
+            return {
+                'connected': self.sock is not None,
+                'reconnects': self.reconnects,
+                'disconnected_seconds': disconnected,
+            }
@@ -1,6 +1,9 @@
 from camera_stream import CameraStream
 from audio_stream import AudioStream
-from output_service import OutputService
+from output_service import OutputService, OVERFLOW_INTERRUPT
+from mux import MuxConnection, CHANNEL_OUTPUT, CHANNEL_CONTROL, CHANNEL_AUDIO, CHANNEL_VIDEO, ECHO
+from latency import dump_all
+import metrics
 import time
 import signal
 import sys
@@ -10,19 +13,59 @@ def signal_handler(sig, frame):
     camera_stream.stop()
     audio_stream.stop()
     output_service.stop()
+    if mux:
+        print(mux.stats())
+        mux.stop()
+    dump_all(monitors.values())
     sys.exit(0)
 
+def dump_latency(sig, frame):
+    # kill -USR1 <pid> prints the latency and loss histograms
+    dump_all(monitors.values())
+
 if __name__ == "__main__":
     # Configure these with your PC's IP address
     PC_IP = "192.168.1.100"  
+    # Carry camera, audio and output over one connection to MUX_PORT
+    MULTIPLEX = False
+    MUX_PORT = 8003
+    # Microphone codec: 'pcm', 'ulaw' (2:1) or 'adpcm' (~3.5:1)
+    AUDIO_CODEC = 'adpcm'
+    # Prometheus metrics on http://<pi>:METRICS_PORT/metrics, None to disable
+    # (not 9100, which node_exporter usually holds on a Pi)
+    METRICS_PORT = 8004
     
     # Initialize services
-    camera_stream = CameraStream(server_ip=PC_IP, server_port=8000)
-    audio_stream = AudioStream(server_ip=PC_IP, server_port=8001)
-    output_service = OutputService(port=8002)
+    mux = None
+    # Stream monitors by mux channel, for echoes received on the control channel
+    monitors = {}
+    if MULTIPLEX:
+        # Clips arrive on the mux receive thread, which must not wait for
+        # playback, so a new clip cuts off a full queue
+        output_service = OutputService(listen=False, overflow=OVERFLOW_INTERRUPT)
+        
+        def on_message(channel, payload):
+            if channel == CHANNEL_OUTPUT:
+                output_service.play(payload)
+            elif channel == CHANNEL_CONTROL and len(payload) == ECHO.size:
+                stream, seq, timestamp = ECHO.unpack(payload)
+                if stream in monitors:
+                    monitors[stream].record(seq, timestamp)
+        
+        mux = MuxConnection(PC_IP, MUX_PORT, on_message=on_message)
+        mux.start()
+        metrics.REGISTRY.add_stats('mux', mux.stats, counters=('messages', 'bytes', 'dropped'))
+        print("Multiplexed connection established")
+    else:
+        output_service = OutputService(port=8002)
+    camera_stream = CameraStream(server_ip=PC_IP, server_port=8000, mux=mux)
+    audio_stream = AudioStream(server_ip=PC_IP, server_port=8001, mux=mux, codec=AUDIO_CODEC)
+    monitors[CHANNEL_VIDEO] = camera_stream.monitor
+    monitors[CHANNEL_AUDIO] = audio_stream.monitor
     
-    # Register signal handler
+    # Register signal handlers
     signal.signal(signal.SIGINT, signal_handler)
+    signal.signal(signal.SIGUSR1, dump_latency)
     
     try:
         # Start services
@@ -35,6 +78,14 @@ if __name__ == "__main__":
         output_service.start()
         print("Output service started")
         
+        if METRICS_PORT:
+            # A busy port only costs the stats endpoint, not the streams
+            try:
+                metrics.serve(METRICS_PORT)
+                print(f"Metrics on port {METRICS_PORT}")
+            except OSError as e:
+                print(f"Metrics server error: {e}")
+        
         print("All services running. Press Ctrl+C to exit.")
         
         # Keep main thread alive
@@ -0,0 +1,228 @@
+import collections
+import socket
+import struct
+import threading
+import time
+from connection import ReconnectingConnection
+
+# Channel ids carried in every mux frame
+CHANNEL_CONTROL = 0
+CHANNEL_AUDIO = 1
+CHANNEL_VIDEO = 2
+CHANNEL_OUTPUT = 3  # Server to Pi: audio clips to play
+
+CHANNEL_NAMES = {
+    CHANNEL_CONTROL: 'control',
+    CHANNEL_AUDIO: 'audio',
+    CHANNEL_VIDEO: 'video',
+    CHANNEL_OUTPUT: 'output',
+}
+
+# Set on every fragment of a message except the last
+FLAG_MORE = 1
+
+# channel id, flags, fragment length
+FRAME_HEADER = struct.Struct('!BBI')
+
+# Control message from the server echoing a processed media message:
+# channel id, sequence number, capture timestamp
+ECHO = struct.Struct('!BId')
+
+
+class ChannelStats:
+    def __init__(self):
+        self.messages = 0
+        self.bytes = 0
+        self.dropped = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self.latency_recent = 0.0
+
+    def record(self, size, latency):
+        self.messages += 1
+        self.bytes += size
+        self.latency_total += latency
+        self.latency_max = max(self.latency_max, latency)
+        self.latency_recent = latency
+
+    def as_dict(self):
+        return {
+            'messages': self.messages,
+            'bytes': self.bytes,
+            'dropped': self.dropped,
+            'latency_avg_ms': 1000 * self.latency_total / self.messages if self.messages else 0.0,
+            'latency_max_ms': 1000 * self.latency_max,
+        }
+
+
+class MuxConnection:
+    """Carries all channels of a Pi over one TCP connection
+
+    Audio and control messages have strict priority over video. Video
+    messages are sent in fragments so a large frame never holds audio back
+    for longer than one fragment, and at most video_budget frames wait to
+    be sent (the oldest is dropped). Latency is measured per channel from
+    send() until the message is fully written to the socket.
+
+    A lost connection is reestablished with backoff. Meanwhile at most
+    urgent_budget audio and control messages wait (the oldest is dropped),
+    and the headers set with set_header() open every new connection.
+    """
+
+    def __init__(self, server_ip, server_port, on_message=None,
+                 video_budget=2, urgent_budget=256, fragment_size=16 * 1024):
+        self.server_ip = server_ip
+        self.server_port = server_port
+        self.on_message = on_message
+        self.video_budget = video_budget
+        self.urgent_budget = urgent_budget
+        self.fragment_size = fragment_size
+        self.connection = ReconnectingConnection(server_ip, server_port,
+                                                 on_connect=self._on_connect)
+        self.running = False
+        self.threads = []
+
+        self.condition = threading.Condition()
+        self.urgent = collections.deque()
+        self.video = collections.deque()
+        # Per channel, sent first on every connection, e.g. a stream header
+        self.headers = {}
+        self.stats_by_channel = {channel: ChannelStats() for channel in CHANNEL_NAMES}
+
+    def start(self):
+        """Connect, retrying until the server is reachable, and start the threads"""
+        self.connection.connect()
+        self.running = True
+        for target in (self._send_loop, self._receive_loop):
+            thread = threading.Thread(target=target)
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self):
+        self.running = False
+        with self.condition:
+            self.condition.notify_all()
+        # Also wakes the receive thread
+        self.connection.close()
+        for thread in self.threads:
+            thread.join()
+
+    def set_header(self, channel, payload):
+        """Send payload on channel now and first thing after every reconnect"""
+        with self.condition:
+            self.headers[channel] = payload
+        self.send(channel, payload)
+
+    def send(self, channel, payload):
+        """Queue a message; never blocks"""
+        item = (channel, payload, time.monotonic())
+        with self.condition:
+            if channel == CHANNEL_VIDEO:
+                queue, budget = self.video, self.video_budget
+            else:
+                queue, budget = self.urgent, self.urgent_budget
+            if len(queue) >= budget:
+                dropped_channel = queue.popleft()[0]
+                self.stats_by_channel[dropped_channel].dropped += 1
+            queue.append(item)
+            self.condition.notify()
+
+    def recent_latency(self, channel):
+        return self.stats_by_channel[channel].latency_recent
+
+    def stats(self):
+        with self.condition:
+            stats = {CHANNEL_NAMES[channel]: channel_stats.as_dict()
+                     for channel, channel_stats in self.stats_by_channel.items()}
+            stats['queued_video'] = len(self.video)
+            stats['queued_urgent'] = len(self.urgent)
+        stats.update(self.connection.stats())
+        return stats
+
+    def _on_connect(self, sock):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        with self.condition:
+            headers = list(self.headers.items())
+        # The first connection's headers go out through send()
+        if self.connection.connects:
+            for channel, payload in headers:
+                sock.sendall(FRAME_HEADER.pack(channel, 0, len(payload)) + payload)
+
+    def _send_fragment(self, channel, flags, fragment):
+        self.connection.sendall(FRAME_HEADER.pack(channel, flags, len(fragment)) + fragment)
+
+    def _send_loop(self):
+        # A partly sent video message: (channel, view, enqueued time, offset)
+        current = None
+        while self.running:
+            if not self.connection.connected:
+                if current is not None:
+                    # Its fragments cannot be continued on a new connection
+                    self.stats_by_channel[current[0]].dropped += 1
+                    current = None
+                if not self.connection.connect():
+                    break
+
+            with self.condition:
+                self.condition.wait_for(
+                    lambda: self.urgent or self.video or current or not self.running)
+                if not self.running:
+                    break
+                urgent = self.urgent.popleft() if self.urgent else None
+                if urgent is None and current is None:
+                    channel, payload, enqueued = self.video.popleft()
+                    current = (channel, memoryview(payload).cast('B'), enqueued, 0)
+
+            try:
+                if urgent is not None:
+                    channel, payload, enqueued = urgent
+                    self._send_fragment(channel, 0, bytes(payload))
+                    with self.condition:
+                        self.stats_by_channel[channel].record(len(payload), time.monotonic() - enqueued)
+                    continue
+
+                # One video fragment, then check for audio/control again
+                channel, view, enqueued, offset = current
+                end = min(offset + self.fragment_size, len(view))
+                flags = FLAG_MORE if end < len(view) else 0
+                self._send_fragment(channel, flags, view[offset:end].tobytes())
+            except ConnectionError as e:
+                if self.running:
+                    print(f"Mux send error: {e}, reconnecting")
+                if urgent is not None:
+                    # Sent again first on the next connection
+                    with self.condition:
+                        self.urgent.appendleft(urgent)
+                continue
+
+            if flags:
+                current = (channel, view, enqueued, end)
+            else:
+                current = None
+                with self.condition:
+                    self.stats_by_channel[channel].record(len(view), time.monotonic() - enqueued)
+
+    def _receive_loop(self):
+        # Partial messages being reassembled, per channel
+        partial = {}
+        while self.running:
+            header = self.connection.receive(FRAME_HEADER.size)
+            if header is not None:
+                channel, flags, length = FRAME_HEADER.unpack(header)
+                fragment = self.connection.receive(length) if length else b''
+            if header is None or fragment is None:
+                # Disconnected; the send thread reconnects
+                partial = {}
+                time.sleep(0.1)
+                continue
+
+            if flags & FLAG_MORE:
+                # Collect the fragments and join them once, on the last one
+                partial.setdefault(channel, []).append(fragment)
+                continue
+            if channel in partial:
+                partial[channel].append(fragment)
+                fragment = b''.join(partial.pop(channel))
+            if self.on_message:
+                self.on_message(channel, fragment)
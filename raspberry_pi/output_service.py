@@ -4,55 +4,240 @@ import pyaudio
 import wave
 import io
 import time
+import queue
+from concurrent.futures import ThreadPoolExecutor
 from gtts import gTTS
+from metrics import REGISTRY
+
+# What to do with a new clip when the playback queue is full
+OVERFLOW_DROP = 'drop'            # Discard the new clip
+OVERFLOW_INTERRUPT = 'interrupt'  # Stop the current clip and discard queued ones
+OVERFLOW_QUEUE = 'queue'          # Wait for room, holding a worker meanwhile
+
+PLAYBACK_TIME = REGISTRY.timer('output_playback_seconds', 'Time spent playing one clip',
+                               buckets=(0.5, 1.0, 2.0, 5.0, 10.0, 30.0))
 
 class OutputService:
-    def __init__(self, host='0.0.0.0', port=8002):
+    def __init__(self, host='0.0.0.0', port=8002, rate=24000, workers=2,
+                 queue_size=4, overflow=OVERFLOW_QUEUE, buffer_size=256 * 1024,
+                 listen=True):
         self.host = host
         self.port = port
+        # With listen=False clips only arrive through play(), e.g. from a mux
+        self.listen = listen
+        self.rate = rate
+        self.workers = workers
+        self.overflow = overflow
+        self.chunk_bytes = 2048
         self.running = False
-        
+        self.thread = None
+        self.playback_thread = None
+        self.executor = None
+
+        self.playback_queue = queue.Queue(maxsize=queue_size)
+        # Connections are only accepted while a worker is free, so the rest
+        # wait in the listen backlog rather than in the executor's queue
+        self.slots = threading.BoundedSemaphore(workers)
+        # Bumped to cut off the clip playing; clips carry the generation
+        # they were queued in and stop once it changes
+        self.generation = 0
+        self.lock = threading.Lock()
+        # Preallocated receive buffers, returned to the pool after playback
+        self.buffers = queue.Queue()
+        for _ in range(queue_size + workers + 1):
+            self.buffers.put(bytearray(buffer_size))
+
+        self.played = 0
+        self.dropped = 0
+        self.interrupted = 0
+        REGISTRY.add_stats('output', self.stats, counters=('played', 'dropped', 'interrupted'))
+
     def start(self):
         self.running = True
-        self.thread = threading.Thread(target=self._listen_loop)
-        self.thread.daemon = True
-        self.thread.start()
-        
+        self.executor = ThreadPoolExecutor(max_workers=self.workers)
+        self.playback_thread = threading.Thread(target=self._playback_loop)
+        self.playback_thread.daemon = True
+        self.playback_thread.start()
+        if self.listen:
+            self.thread = threading.Thread(target=self._listen_loop)
+            self.thread.daemon = True
+            self.thread.start()
+
     def stop(self):
         self.running = False
         if self.thread:
             self.thread.join()
-            
+        if self.executor:
+            self.executor.shutdown(wait=False)
+        with self.lock:
+            self.generation += 1
+        # The playback thread may have left its loop already, so make room
+        # for the sentinel rather than waiting for it to take a clip
+        while True:
+            self._drain()
+            try:
+                self.playback_queue.put_nowait(None)
+                break
+            except queue.Full:
+                continue
+        if self.playback_thread:
+            self.playback_thread.join()
+
+    def stats(self):
+        with self.lock:
+            counts = {
+                'played': self.played,
+                'dropped': self.dropped,
+                'interrupted': self.interrupted,
+            }
+        return {
+            **counts,
+            'queued': self.playback_queue.qsize(),
+            'free_buffers': self.buffers.qsize(),
+        }
+
+    def play(self, data):
+        """Queue a clip that was received by other means; never blocks
+
+        It is called from the mux receive thread, which must keep reading.
+        With OVERFLOW_QUEUE a clip that finds the queue full is dropped.
+        """
+        try:
+            buffer = self.buffers.get_nowait()
+        except queue.Empty:
+            buffer = bytearray(len(data))
+        if len(buffer) < len(data):
+            buffer = bytearray(len(data))
+        buffer[:len(data)] = data
+        self._enqueue(buffer, len(data), block=False)
+
     def _listen_loop(self):
         server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         server_socket.bind((self.host, self.port))
-        server_socket.listen(1)
-        
+        server_socket.listen(self.workers)
+        # Wake up periodically so stop() is noticed
+        server_socket.settimeout(1.0)
+
         try:
             while self.running:
-                client, _ = server_socket.accept()
-                threading.Thread(target=self._handle_client, args=(client,)).start()
+                if not self.slots.acquire(timeout=1.0):
+                    continue
+                try:
+                    client, _ = server_socket.accept()
+                except socket.timeout:
+                    self.slots.release()
+                    continue
+                client.settimeout(None)
+                self.executor.submit(self._handle_client, client)
         finally:
             server_socket.close()
-    
-    def _handle_client(self, client):
-        size_bytes = client.recv(4)
-        size = int.from_bytes(size_bytes, byteorder='big')
-        
-        audio_data = b''
-        while len(audio_data) < size:
-            chunk = client.recv(min(4096, size - len(audio_data)))
-            if not chunk:
+
+    def _recv_into(self, client, view):
+        received = 0
+        while received < len(view):
+            count = client.recv_into(view[received:])
+            if not count:
                 break
-            audio_data += chunk
-            
-        client.close()
-        
-        # Play the audio
+            received += count
+        return received
+
+    def _handle_client(self, client):
+        try:
+            self._receive_clip(client)
+        finally:
+            self.slots.release()
+
+    def _receive_clip(self, client):
+        buffer = None
+        try:
+            size_bytes = bytearray(4)
+            if self._recv_into(client, memoryview(size_bytes)) < 4:
+                return
+            size = int.from_bytes(size_bytes, byteorder='big')
+
+            buffer = self.buffers.get()
+            if len(buffer) < size:
+                # Clip larger than the pool's buffers; the bigger one is kept
+                buffer = bytearray(size)
+            with memoryview(buffer) as view:
+                received = self._recv_into(client, view[:size])
+        except Exception as e:
+            print(f"Error receiving audio: {e}")
+            if buffer is not None:
+                self.buffers.put(buffer)
+            return
+        finally:
+            client.close()
+
+        self._enqueue(buffer, received)
+
+    def _drain(self):
+        """Discard queued clips, returning their buffers; returns how many"""
+        count = 0
+        while True:
+            try:
+                item = self.playback_queue.get_nowait()
+            except queue.Empty:
+                return count
+            if item is not None:
+                self.buffers.put(item[0])
+                count += 1
+
+    def _enqueue(self, buffer, size, block=True):
+        if self.overflow == OVERFLOW_QUEUE and block:
+            # Give up once stopped, so the worker does not wait forever
+            while self.running:
+                try:
+                    self.playback_queue.put((buffer, size, self.generation), timeout=1.0)
+                    return
+                except queue.Full:
+                    continue
+            self.buffers.put(buffer)
+            return
+
+        with self.lock:
+            if self.overflow == OVERFLOW_INTERRUPT and self.playback_queue.full():
+                # Discard queued clips and cut off the one playing
+                self.interrupted += self._drain()
+                self.generation += 1
+
+            try:
+                self.playback_queue.put_nowait((buffer, size, self.generation))
+                return
+            except queue.Full:
+                self.dropped += 1
+        self.buffers.put(buffer)
+
+    def _playback_loop(self):
+        # One output stream for the lifetime of the service
         p = pyaudio.PyAudio()
-        stream = p.open(format=pyaudio.paInt16, channels=1, rate=24000, output=True)
-        stream.write(audio_data)
-        stream.stop_stream()
-        stream.close()
-        p.terminate()
\ No newline at end of file
+        stream = p.open(format=pyaudio.paInt16, channels=1, rate=self.rate, output=True)
+
+        try:
+            while self.running:
+                item = self.playback_queue.get()
+                if item is None:
+                    break
+                buffer, size, generation = item
+                start = time.monotonic()
+                try:
+                    with memoryview(buffer) as view:
+                        for offset in range(0, size, self.chunk_bytes):
+                            if self.generation != generation:
+                                with self.lock:
+                                    self.interrupted += 1
+                                break
+                            stream.write(view[offset:min(offset + self.chunk_bytes, size)].tobytes())
+                        else:
+                            with self.lock:
+                                self.played += 1
+                except Exception as e:
+                    print(f"Playback error: {e}")
+                finally:
+                    PLAYBACK_TIME.observe(time.monotonic() - start)
+                    self.buffers.put(buffer)
+        finally:
+            stream.stop_stream()
+            stream.close()
+            p.terminate()